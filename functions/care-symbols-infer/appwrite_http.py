@@ -0,0 +1,149 @@
+"""
+Shared HTTP session for Appwrite REST calls.
+All Storage and Databases requests go through one module-level requests
+Session, so TCP+TLS handshakes are paid once per container instead of on
+every call. The session keeps connections alive in bounded pools, applies
+per-operation timeouts, and retries idempotent GETs with jittered backoff.
+POSTs (inline image uploads) go through the same pool without retries.
+"""
+
+import os
+import threading
+
+# (connect, read) timeouts in seconds for each kind of call
+TIMEOUTS = {
+    "image": (3.05, 30),
+    "metadata": (3.05, 10),
+    "model_metadata": (3.05, 10),
+    "model": (3.05, 120),
+    "upload": (3.05, 60),
+}
+
+# Transient statuses worth retrying
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _build_retry():
+    """Retry policy for idempotent GETs: exponential backoff with jitter"""
+    from urllib3.util.retry import Retry
+
+    retries = int(os.environ.get("HTTP_RETRIES") or 3)
+    options = dict(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=0.2,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    try:
+        return Retry(backoff_jitter=0.3, **options)
+    except TypeError:
+        # urllib3 < 2 has no built-in jitter
+        return Retry(**options)
+
+
+def get_session():
+    """Return the process-wide pooled session, creating it on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                pool_size = int(os.environ.get("HTTP_POOL_SIZE") or 16)
+                adapter = HTTPAdapter(
+                    pool_connections=4,
+                    pool_maxsize=pool_size,
+                    max_retries=_build_retry(),
+                )
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def appwrite_request(path):
+    """Build the URL and auth headers for an Appwrite REST call"""
+    endpoint = os.environ.get("APPWRITE_ENDPOINT")
+    project_id = os.environ.get("APPWRITE_PROJECT_ID")
+    api_key = os.environ.get("APPWRITE_API_KEY")
+
+    url = f"{endpoint}{path}"
+    headers = {
+        "X-Appwrite-Project": project_id,
+        "X-Appwrite-Key": api_key
+    }
+    return url, headers
+
+
+def appwrite_get(path, operation, **kwargs):
+    """
+    GET an Appwrite REST path through the shared session.
+
+    Args:
+        path: Path below APPWRITE_ENDPOINT, e.g. "/storage/buckets/b/files/f"
+        operation: Key into TIMEOUTS ("image", "metadata", "model_metadata", "model")
+        **kwargs: Passed through to requests (params, stream, ...)
+
+    Returns:
+        requests.Response (status not checked)
+    """
+    url, headers = appwrite_request(path)
+    kwargs.setdefault("timeout", TIMEOUTS[operation])
+    return get_session().get(url, headers=headers, **kwargs)
+
+
+def appwrite_post(path, operation, **kwargs):
+    """
+    POST to an Appwrite REST path through the shared session.
+
+    POSTs are not idempotent, so the session's retry policy does not
+    retry them.
+
+    Args:
+        path: Path below APPWRITE_ENDPOINT
+        operation: Key into TIMEOUTS
+        **kwargs: Passed through to requests (data, files, json, ...)
+
+    Returns:
+        requests.Response (status not checked)
+    """
+    url, headers = appwrite_request(path)
+    kwargs.setdefault("timeout", TIMEOUTS[operation])
+    return get_session().post(url, headers=headers, **kwargs)
+
+
+def connection_stats():
+    """
+    Report how many requests reused a pooled connection.
+
+    Counts come from the urllib3 connection pools behind the session; a pool
+    that was evicted from the pool manager takes its counts with it.
+    """
+    stats = {"requests": 0, "connections": 0, "reused": 0, "pools": 0}
+    if _session is None:
+        return stats
+
+    # The same adapter is mounted for http:// and https://
+    adapters = {id(adapter): adapter for adapter in _session.adapters.values()}
+    for adapter in adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats["pools"] += 1
+            stats["requests"] += pool.num_requests
+            stats["connections"] += pool.num_connections
+
+    stats["reused"] = max(0, stats["requests"] - stats["connections"])
+    return stats
@@ -0,0 +1,169 @@
+"""
+Local stand-in for the Appwrite REST endpoints the function calls.
+
+Serves Storage file metadata, downloads and resized previews and the Databases
+document list from memory, with configurable latency and failure injection, so the function
+can be exercised and benchmarked without an Appwrite project.
+
+    stub = AppwriteStub(latency_ms=20, failure_rate=0.05)
+    stub.add_file("uploads", "tag1", jpeg_bytes)
+    stub.set_documents([{"title": "Cold Wash", ...}])
+    stub.start()
+    os.environ["APPWRITE_ENDPOINT"] = stub.endpoint
+"""
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FILE_PATH = re.compile(r"^/v1/storage/buckets/([^/]+)/files/([^/]+)(/download|/preview)?$")
+DOCUMENTS_PATH = re.compile(r"^/v1/databases/([^/]+)/collections/([^/]+)/documents$")
+
+
+class AppwriteStub:
+    """In-memory Appwrite Storage + Databases stand-in on a local port"""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, failure_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.files = {}
+        self.documents = []
+        self.request_counts = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def endpoint(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def add_file(self, bucket_id, file_id, content):
+        self.files[(bucket_id, file_id)] = content
+
+    def set_documents(self, documents):
+        self.documents = list(documents)
+
+    def start(self, host="127.0.0.1", port=0):
+        """Start serving on a background thread (port 0 picks a free port)"""
+        stub = self
+
+        class Handler(_Handler):
+            pass
+        Handler.stub = stub
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _count(self, kind):
+        with self._lock:
+            self.request_counts[kind] = self.request_counts.get(kind, 0) + 1
+
+    def _delay_and_maybe_fail(self):
+        """Sleep for the configured latency; return True if this request should fail"""
+        with self._lock:
+            delay = self.latency_ms + self._random.uniform(0, self.jitter_ms)
+            fail = self._random.random() < self.failure_rate
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+        return fail
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    stub = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        stub = self.stub
+        url = urlparse(self.path)
+
+        match = FILE_PATH.match(url.path)
+        if match:
+            bucket_id, file_id, suffix = match.groups()
+            kind = (suffix or "/metadata").lstrip("/")
+            stub._count(kind)
+            if stub._delay_and_maybe_fail():
+                return self._send(503, {"message": "Injected failure", "code": 503})
+
+            content = stub.files.get((bucket_id, file_id))
+            if content is None:
+                return self._send(404, {"message": "File not found", "code": 404})
+            if suffix == "/preview":
+                return self._send(200, _render_preview(content, parse_qs(url.query)), "image/jpeg")
+            if suffix:
+                return self._send(200, content, "application/octet-stream")
+            return self._send(200, {
+                "$id": file_id,
+                "bucketId": bucket_id,
+                "signature": hashlib.md5(content).hexdigest(),
+                "sizeOriginal": len(content),
+                "mimeType": "application/octet-stream",
+            })
+
+        match = DOCUMENTS_PATH.match(url.path)
+        if match:
+            stub._count("documents")
+            if stub._delay_and_maybe_fail():
+                return self._send(503, {"message": "Injected failure", "code": 503})
+            return self._send(200, _list_documents(stub.documents, parse_qs(url.query)))
+
+        return self._send(404, {"message": "Route not found", "code": 404})
+
+
+def _render_preview(content, query):
+    """Resize like Appwrite's preview: width/height scale proportionally, both crop"""
+    from io import BytesIO
+    from PIL import Image, ImageOps
+
+    img = Image.open(BytesIO(content)).convert("RGB")
+    width = int(query.get("width", ["0"])[0])
+    height = int(query.get("height", ["0"])[0])
+    if width and height:
+        img = ImageOps.fit(img, (width, height))
+    elif width or height:
+        scale = width / img.width if width else height / img.height
+        img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))))
+    out = BytesIO()
+    img.save(out, "JPEG", quality=int(query.get("quality", ["90"])[0]))
+    return out.getvalue()
+
+
+def _list_documents(documents, query):
+    """Apply the subset of Appwrite queries the function uses: equal, limit, offset"""
+    limit, offset = 25, 0
+    matched = documents
+    for raw in query.get("queries[]", []):
+        q = json.loads(raw)
+        if q["method"] == "equal":
+            matched = [d for d in matched if d.get(q["attribute"]) in q["values"]]
+        elif q["method"] == "limit":
+            limit = q["values"][0]
+        elif q["method"] == "offset":
+            offset = q["values"][0]
+    return {"total": len(matched), "documents": matched[offset:offset + limit]}
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the inference function against a local Appwrite stand-in.
+
+Generates a small synthetic TFLite model (needs `pip install tensorflow`, or
+pass --model) and sample tag photos, serves them from benchmarks/appwrite_stub.py,
+and drives main() through a fake Appwrite context in a fresh subprocess so
+import time, cold start and peak memory are measured from scratch.
+
+Reports cold-start time, warm p50/p99 latency, throughput at a given
+concurrency and peak RSS as JSON. With --baseline, exits non-zero if latency
+regressed by more than --max-regression against a previous report.
+
+Usage:
+    python benchmarks/harness.py --output bench.json
+    python benchmarks/harness.py --latency-ms 30 --failure-rate 0.05 --concurrency 8
+    python benchmarks/harness.py --baseline bench.json --max-regression 0.2
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FUNCTION_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, FUNCTION_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+IMAGE_BUCKET = "uploads"
+MODEL_BUCKET = "models"
+MODEL_FILE = "care-symbols-model"
+DATABASE = "bench-db"
+COLLECTION = "care_symbols"
+
+# Photo sizes to cycle through: a cropped tag, a 2MP and a 12MP phone photo
+IMAGE_SIZES = [(600, 800), (1200, 1600), (3000, 4000)]
+
+
+def generate_model(path, input_size=224, num_classes=39):
+    """Write a tiny float32 TFLite classifier with a dynamic batch dimension"""
+    try:
+        import tensorflow as tf
+    except ImportError:
+        sys.exit("Generating the synthetic model needs tensorflow; install it or pass --model")
+
+    inputs = tf.keras.Input((input_size, input_size, 3))
+    x = tf.keras.layers.Conv2D(8, 3, strides=2, activation="relu")(inputs)
+    x = tf.keras.layers.Conv2D(16, 3, strides=2, activation="relu")(x)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    outputs = tf.keras.layers.Dense(num_classes, activation="sigmoid")(x)
+    model = tf.keras.Model(inputs, outputs)
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    with open(path, "wb") as f:
+        f.write(converter.convert())
+
+
+def generate_images(count):
+    """Synthetic JPEG tag photos, cycling through IMAGE_SIZES"""
+    from preprocess_benchmark import make_test_image
+
+    images = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(count):
+            width, height = IMAGE_SIZES[i % len(IMAGE_SIZES)]
+            path = os.path.join(tmp, f"tag{i}.jpg")
+            make_test_image(path, width=width, height=height)
+            with open(path, "rb") as f:
+                images.append(f.read())
+    return images
+
+
+def symbol_documents():
+    """care_symbols rows matching the predictor's class names"""
+    from predict import CareSymbolPredictor
+
+    # _get_class_names does not touch instance state
+    titles = CareSymbolPredictor._get_class_names(None)
+    return [
+        {
+            "$id": f"symbol{i}",
+            "title": title,
+            "shortDescription": f"{title} description",
+            "dos": "Do this",
+            "donts": "Don't do that",
+            "image": f"image{i}",
+            "category": "bench",
+        }
+        for i, title in enumerate(titles)
+    ]
+
+
+class FakeResponse:
+    def json(self, data, status_code=200, headers=None):
+        return data
+
+    def send(self, body, status_code=200, headers=None):
+        return {"body": body, "statusCode": status_code, "headers": headers or {}}
+
+    def empty(self):
+        return {"statusCode": 204}
+
+
+class FakeRequest:
+    def __init__(self, body, headers=None):
+        self.body = body
+        self.headers = headers or {}
+
+
+class FakeContext:
+    """Just enough of the Appwrite runtime context for main()"""
+
+    def __init__(self, payload, headers=None):
+        self.req = FakeRequest(json.dumps(payload), headers)
+        self.res = FakeResponse()
+
+    def log(self, message):
+        pass
+
+    def error(self, message):
+        pass
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    if not samples:
+        return None
+    return round(samples[min(len(samples) - 1, int(p / 100.0 * len(samples)))], 2)
+
+
+def peak_rss_mb():
+    from preprocess_benchmark import peak_rss_mb as _peak_rss_mb
+    return round(_peak_rss_mb(), 1)
+
+
+def run_measurements(args):
+    """Child process: import main, then time cold, warm and concurrent calls"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    file_ids = [f"tag{i}" for i in range(args.images)]
+
+    import_start = time.perf_counter()
+    import main
+    import predict
+    import_ms = (time.perf_counter() - import_start) * 1000
+
+    # Download the model into the scratch directory, never the real /tmp cache
+    predict.MODEL_CACHE_DIR = os.path.join(args.workdir, "models")
+
+    errors = []
+
+    def call(i):
+        payload = {"fileId": file_ids[i % len(file_ids)], "topK": 5, "threshold": 0.1}
+        start = time.perf_counter()
+        result = main.main(FakeContext(payload))
+        elapsed = (time.perf_counter() - start) * 1000
+        if not result.get("success"):
+            errors.append(result.get("error"))
+        return elapsed
+
+    cold_ms = call(0)
+
+    warm = [call(i) for i in range(1, args.requests + 1)]
+
+    concurrent_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        concurrent = list(executor.map(call, range(args.concurrent_requests)))
+    concurrent_wall = time.perf_counter() - concurrent_start
+
+    return {
+        "importMs": round(import_ms, 2),
+        "coldStartMs": round(import_ms + cold_ms, 2),
+        "firstRequestMs": round(cold_ms, 2),
+        "warm": {
+            "requests": len(warm),
+            "p50Ms": percentile(warm, 50),
+            "p99Ms": percentile(warm, 99),
+            "meanMs": round(sum(warm) / len(warm), 2) if warm else None,
+        },
+        "throughput": {
+            "concurrency": args.concurrency,
+            "requests": len(concurrent),
+            "requestsPerSecond": round(len(concurrent) / concurrent_wall, 2),
+            "p50Ms": percentile(concurrent, 50),
+            "p99Ms": percentile(concurrent, 99),
+        },
+        "peakRssMb": peak_rss_mb(),
+        "errors": len(errors),
+        "sampleErrors": errors[:3],
+    }
+
+
+def compare_to_baseline(report, baseline, max_regression):
+    """Return a list of metrics that regressed beyond the allowed ratio"""
+    checks = [
+        ("coldStartMs", report["coldStartMs"], baseline.get("coldStartMs")),
+        ("warm.p50Ms", report["warm"]["p50Ms"], baseline.get("warm", {}).get("p50Ms")),
+        ("warm.p99Ms", report["warm"]["p99Ms"], baseline.get("warm", {}).get("p99Ms")),
+        ("peakRssMb", report["peakRssMb"], baseline.get("peakRssMb")),
+    ]
+    regressions = []
+    for name, current, previous in checks:
+        if current is not None and previous and current > previous * (1 + max_regression):
+            regressions.append(f"{name}: {previous} -> {current}")
+    throughput = report["throughput"]["requestsPerSecond"]
+    previous = baseline.get("throughput", {}).get("requestsPerSecond")
+    if previous and throughput < previous / (1 + max_regression):
+        regressions.append(f"throughput.requestsPerSecond: {previous} -> {throughput}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="TFLite model to serve (default: generate a synthetic one)")
+    parser.add_argument("--images", type=int, default=6, help="Number of sample photos")
+    parser.add_argument("--requests", type=int, default=30, help="Sequential warm requests")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--concurrent-requests", type=int, default=40)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Stub latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Random extra stub latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of stub requests answered with 503")
+    parser.add_argument("--result-cache", action="store_true", help="Keep the result cache on (off by default so inference is measured)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Extra function environment variables")
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout")
+    parser.add_argument("--baseline", help="Previous JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed slowdown ratio vs baseline")
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--measure", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(run_measurements(args)))
+        return
+
+    from appwrite_stub import AppwriteStub
+
+    with tempfile.TemporaryDirectory() as workdir:
+        model_path = args.model
+        if not model_path:
+            model_path = os.path.join(workdir, "model.tflite")
+            generate_model(model_path)
+        with open(model_path, "rb") as f:
+            model_content = f.read()
+
+        stub = AppwriteStub(
+            latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+            failure_rate=args.failure_rate, seed=0
+        )
+        stub.add_file(MODEL_BUCKET, MODEL_FILE, model_content)
+        for i, image in enumerate(generate_images(args.images)):
+            stub.add_file(IMAGE_BUCKET, f"tag{i}", image)
+        stub.set_documents(symbol_documents())
+        stub.start()
+
+        env = dict(os.environ)
+        env.update({
+            "APPWRITE_ENDPOINT": stub.endpoint,
+            "APPWRITE_PROJECT_ID": "bench",
+            "APPWRITE_API_KEY": "bench",
+            "BUCKET_ID": IMAGE_BUCKET,
+            "DATABASE_ID": DATABASE,
+            "COLLECTION_ID": COLLECTION,
+            "MODEL_BUCKET_ID": MODEL_BUCKET,
+            "MODEL_FILE_ID": MODEL_FILE,
+            "LOG_LEVEL": "ERROR",
+        })
+        env.pop("MODEL_PATH", None)
+        if not args.result_cache:
+            env["RESULT_CACHE_SIZE"] = "0"
+            env.pop("RESULT_CACHE_DIR", None)
+        for item in args.env:
+            key, _, value = item.partition("=")
+            env[key] = value
+
+        command = [
+            sys.executable, os.path.abspath(__file__), "--measure",
+            "--workdir", workdir,
+            "--images", str(args.images),
+            "--requests", str(args.requests),
+            "--concurrency", str(args.concurrency),
+            "--concurrent-requests", str(args.concurrent_requests),
+        ]
+        output = subprocess.check_output(command, env=env, cwd=FUNCTION_DIR)
+        stub.stop()
+
+    report = json.loads(output.decode().strip().splitlines()[-1])
+    report["config"] = {
+        "model": args.model or "synthetic",
+        "modelBytes": len(model_content),
+        "images": args.images,
+        "latencyMs": args.latency_ms,
+        "jitterMs": args.jitter_ms,
+        "failureRate": args.failure_rate,
+        "resultCache": args.result_cache,
+        "env": args.env,
+    }
+    report["stubRequests"] = stub.request_counts
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(report, baseline, args.max_regression)
+        if regressions:
+            print("Regressions beyond {:.0%}:".format(args.max_regression), file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Benchmark image preprocessing: the original full-decode path vs the
+draft-mode decode + in-place tensor fill used by predict.py.
+
+Each variant runs in its own subprocess so peak RSS is measured in isolation.
+No model is needed: the fast path fills a preallocated buffer shaped like the
+interpreter's input tensor.
+
+Usage:
+    python benchmarks/preprocess_benchmark.py
+    python benchmarks/preprocess_benchmark.py --image tag.jpg --iterations 20 --dtype uint8
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+FUNCTION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, FUNCTION_DIR)
+
+
+def make_test_image(path, width=4000, height=3000):
+    """Write a synthetic 12MP JPEG that looks roughly like a photo (smooth, not noise)"""
+    import numpy as np
+    from PIL import Image
+
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    r = 127 + 120 * np.sin(x / 97.0)
+    g = 127 + 120 * np.cos(y / 61.0)
+    b = 127 + 120 * np.sin((x + y) / 143.0)
+    pixels = np.stack([r, g, b], axis=-1).astype(np.uint8)
+    Image.fromarray(pixels).save(path, quality=90)
+
+
+def legacy_preprocess(image_bytes, target_size, dtype):
+    """The original _preprocess_image, minus its log lines (but with its debug reductions)"""
+    import numpy as np
+    from PIL import Image
+
+    img = Image.open(BytesIO(image_bytes))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    img = img.resize(target_size)
+    img_array = np.array(img)
+    if dtype == "uint8":
+        img_array = img_array.astype('uint8')
+    else:
+        img_array = img_array.astype('float32') / 255.0
+    img_array.min(), img_array.max()
+    return np.expand_dims(img_array, axis=0)
+
+
+def fast_preprocess(image_bytes, target_size, input_buffer):
+    """decode_image + fill_input into a buffer standing in for the input tensor"""
+    from predict import decode_image, fill_input
+
+    pixels = decode_image(image_bytes, target_size)
+    fill_input(input_buffer[0], pixels)
+    return input_buffer
+
+
+def peak_rss_mb():
+    """
+    Peak RSS of this process in MB.
+
+    Reads VmHWM on Linux: unlike ru_maxrss it is not inherited from the
+    parent across fork/exec, so each variant subprocess starts from zero.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+def run_variant(variant, image_path, iterations, size, dtype):
+    """Run one variant in this process and return its measurements"""
+    import numpy as np
+
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+    target_size = (size, size)
+    input_buffer = np.zeros((1, size, size, 3), dtype=np.uint8 if dtype == "uint8" else np.float32)
+
+    def once():
+        if variant == "legacy":
+            legacy_preprocess(image_bytes, target_size, dtype)
+        else:
+            fast_preprocess(image_bytes, target_size, input_buffer)
+
+    # Warm up imports and allocator before timing
+    once()
+
+    cpu_times = []
+    wall_times = []
+    for _ in range(iterations):
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        once()
+        cpu_times.append((time.process_time() - cpu_start) * 1000)
+        wall_times.append((time.perf_counter() - wall_start) * 1000)
+
+    cpu_times.sort()
+    wall_times.sort()
+    return {
+        "variant": variant,
+        "iterations": iterations,
+        "cpuMsMedian": round(cpu_times[len(cpu_times) // 2], 2),
+        "wallMsMedian": round(wall_times[len(wall_times) // 2], 2),
+        "wallMsMin": round(wall_times[0], 2),
+        "peakRssMb": round(peak_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", help="Image to preprocess (default: generated 12MP JPEG)")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--size", type=int, default=224, help="Model input width/height")
+    parser.add_argument("--dtype", choices=["float32", "uint8"], default="float32")
+    parser.add_argument("--variant", choices=["legacy", "fast"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(run_variant(args.variant, args.image, args.iterations, args.size, args.dtype)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image_path = args.image
+        if not image_path:
+            image_path = os.path.join(tmp, "tag_12mp.jpg")
+            make_test_image(image_path)
+
+        results = []
+        for variant in ("legacy", "fast"):
+            output = subprocess.check_output([
+                sys.executable, os.path.abspath(__file__),
+                "--variant", variant,
+                "--image", image_path,
+                "--iterations", str(args.iterations),
+                "--size", str(args.size),
+                "--dtype", args.dtype,
+            ])
+            results.append(json.loads(output.decode().strip().splitlines()[-1]))
+
+    legacy, fast = results
+    print(json.dumps({
+        "image": args.image or "synthetic 4000x3000 JPEG",
+        "dtype": args.dtype,
+        "results": results,
+        "cpuSpeedup": round(legacy["cpuMsMedian"] / max(fast["cpuMsMedian"], 1e-6), 2),
+        "peakRssSavedMb": round(legacy["peakRssMb"] - fast["peakRssMb"], 1),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
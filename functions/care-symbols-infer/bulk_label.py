@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Label an archive of tag photos offline with CareSymbolPredictor.
+
+Images are streamed from a directory tree or a manifest, decoded and resized
+in a pool of worker processes, and classified in batches in the main
+process. Results are appended to a JSONL or CSV file as each batch finishes.
+That file doubles as the checkpoint: --resume skips every path it already
+contains. Only a bounded window of images is in memory at any time.
+
+Model configuration matches the function: --model, or MODEL_PATH /
+MODEL_BUCKET_ID + MODEL_FILE_ID (with the APPWRITE_* variables) from the
+environment.
+
+Usage:
+    python bulk_label.py --input-dir archive/ --output labels.jsonl --model care_symbols_model.tflite
+    python bulk_label.py --manifest paths.txt --output labels.csv --batch-size 32 --workers 8
+    python bulk_label.py --input-dir archive/ --output labels.jsonl --resume
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Package-relative import when imported as a package, plain import when run as a script
+try:
+    from .predict import CareSymbolPredictor, decode_image
+    from .telemetry import log
+except ImportError:
+    from predict import CareSymbolPredictor, decode_image
+    from telemetry import log
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif", ".tif", ".tiff")
+CSV_FIELDS = ["path", "labels", "error"]
+
+
+def iter_directory(root):
+    """Image paths under root, depth first, without listing the whole tree up front"""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        with os.scandir(directory) as entries:
+            entries = sorted(entries, key=lambda e: e.name)
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+            elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                yield entry.path
+
+
+def iter_manifest(manifest):
+    """
+    Paths from a manifest: one path per line, a CSV with a 'path' column, or
+    JSONL objects with a 'path' key. Relative paths resolve against the
+    manifest's directory.
+    """
+    base = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, newline="") as f:
+        if manifest.endswith(".csv"):
+            rows = (row.get("path") for row in csv.DictReader(f))
+        elif manifest.endswith(".jsonl"):
+            rows = (json.loads(line).get("path") for line in f if line.strip())
+        else:
+            rows = (line.strip() for line in f)
+        for path in rows:
+            if path:
+                yield path if os.path.isabs(path) else os.path.join(base, path)
+
+
+def completed_paths(output, fmt):
+    """
+    Paths already in the output file, for --resume.
+
+    A line cut off by a crash is truncated away so appends start clean.
+    """
+    done = set()
+    if not os.path.exists(output):
+        return done
+
+    with open(output, "rb+") as f:
+        data_end = f.seek(0, os.SEEK_END)
+        if data_end:
+            f.seek(data_end - 1)
+            if f.read(1) != b"\n":
+                f.seek(0)
+                content = f.read()
+                f.truncate(content.rfind(b"\n") + 1)
+
+    with open(output, newline="") as f:
+        if fmt == "csv":
+            for row in csv.DictReader(f):
+                done.add(row["path"])
+        else:
+            for line in f:
+                if line.strip():
+                    done.add(json.loads(line)["path"])
+    return done
+
+
+def _decode(path, input_size):
+    """Worker process: read and preprocess one image"""
+    try:
+        with open(path, "rb") as f:
+            return path, decode_image(f.read(), input_size), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def decode_stream(paths, input_size, workers, window):
+    """
+    Decode paths in worker processes, yielding (path, pixels, error) in order.
+
+    At most `window` images are submitted or waiting to be consumed, so memory
+    stays flat however large the archive is.
+    """
+    # spawn, not fork: the parent already holds interpreter threads
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        pending = deque()
+        for path in paths:
+            pending.append(executor.submit(_decode, path, input_size))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class ResultWriter:
+    """Appends one row per image and flushes after every batch"""
+
+    def __init__(self, output, fmt, append):
+        self.fmt = fmt
+        exists = append and os.path.exists(output) and os.path.getsize(output) > 0
+        self._file = open(output, "a" if append else "w", newline="")
+        self._csv = None
+        if fmt == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=CSV_FIELDS)
+            if not exists:
+                self._csv.writeheader()
+
+    def write(self, path, predictions=None, error=None):
+        if self._csv is not None:
+            labels = ";".join(f"{p['label']}:{p['confidence']:.4f}" for p in predictions or [])
+            self._csv.writerow({"path": path, "labels": labels, "error": error or ""})
+        elif error is not None:
+            self._file.write(json.dumps({"path": path, "error": error}) + "\n")
+        else:
+            self._file.write(json.dumps({"path": path, "predictions": predictions}) + "\n")
+
+    def flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+def label(args):
+    fmt = args.format or ("csv" if args.output.endswith(".csv") else "jsonl")
+    predictor = CareSymbolPredictor(
+        model_path=args.model or os.environ.get("MODEL_PATH"),
+        model_bucket_id=os.environ.get("MODEL_BUCKET_ID"),
+        model_file_id=os.environ.get("MODEL_FILE_ID"),
+    )
+    input_size = CareSymbolPredictor.input_size()
+
+    done = completed_paths(args.output, fmt) if args.resume else set()
+    if done:
+        log(f"Resuming: {len(done)} images already labeled in {args.output}")
+
+    paths = iter_manifest(args.manifest) if args.manifest else iter_directory(args.input_dir)
+    skipped = 0
+
+    def todo():
+        nonlocal skipped
+        for path in paths:
+            if path in done:
+                skipped += 1
+            else:
+                yield path
+
+    workers = args.workers or max(1, (os.cpu_count() or 1) - 1)
+    window = max(args.batch_size * 2, workers * 4)
+    writer = ResultWriter(args.output, fmt, append=args.resume)
+
+    started = time.perf_counter()
+    last_report = started
+    labeled = errors = 0
+    batch = []
+
+    def flush_batch():
+        nonlocal labeled
+        if not batch:
+            return
+        scores = predictor.scores_pixels([pixels for _, pixels in batch])
+        for (path, _), row in zip(batch, scores):
+            writer.write(path, predictions=predictor.labels(row, args.top_k, args.threshold))
+        labeled += len(batch)
+        batch.clear()
+        writer.flush()
+
+    try:
+        for path, pixels, error in decode_stream(todo(), input_size, workers, window):
+            if error is not None:
+                errors += 1
+                writer.write(path, error=error)
+            else:
+                batch.append((path, pixels))
+                if len(batch) >= args.batch_size:
+                    flush_batch()
+
+            now = time.perf_counter()
+            if now - last_report >= args.progress_every:
+                rate = (labeled + errors) / (now - started)
+                log(f"{labeled} labeled, {errors} failed, {skipped} skipped, {rate:.1f} images/sec")
+                last_report = now
+        flush_batch()
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "output": args.output,
+        "labeled": labeled,
+        "failed": errors,
+        "skipped": skipped,
+        "seconds": round(elapsed, 2),
+        "imagesPerSecond": round((labeled + errors) / elapsed, 2) if elapsed else None,
+        "decodeWorkers": workers,
+        "batchSize": args.batch_size,
+        "modelId": predictor.model_id,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input-dir", help="Directory tree of images")
+    source.add_argument("--manifest", help="File listing image paths (.txt, .csv with 'path', or .jsonl)")
+    parser.add_argument("--output", required=True, help="Results file (.jsonl or .csv)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="Default: from the output extension")
+    parser.add_argument("--model", help="TFLite model path (default: MODEL_PATH or Storage variables)")
+    parser.add_argument("--batch-size", type=int, default=32, help="Images per invoke")
+    parser.add_argument("--workers", type=int, help="Decode processes (default: cores - 1)")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--resume", action="store_true", help="Skip images already in --output and append")
+    parser.add_argument("--progress-every", type=float, default=10.0, help="Seconds between progress lines")
+    args = parser.parse_args()
+
+    summary = label(args)
+    print(json.dumps(summary, indent=2))
+    return 0 if summary["labeled"] or not summary["failed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,49 +4,288 @@ Convert TensorFlow .keras model to TFLite format for ultralight inference.
 
 TFLite Runtime is ~5MB vs ~590MB for full TensorFlow.
 
+Builds one or more variants of the model:
+
+    float32  no quantization
+    float16  float16 weights, float32 compute on CPU
+    dynamic  int8 weights, float activations (Optimize.DEFAULT)
+    int8     full integer with uint8 input/output, calibrated on a
+             representative dataset of tag images (--dataset)
+
+Each variant is validated against the Keras model on images from --dataset,
+and a report is written with model size, load time, per-image CPU latency
+and top-1/top-k agreement. The fastest variant whose agreement stays within
+the accuracy budget is marked as recommended. predict.py applies the
+input quantization of integer models, so any variant can be uploaded as is.
+
 Usage:
     pip install tensorflow
     python convert_to_tflite.py
+    python convert_to_tflite.py --keras model.keras --dataset tags/ --variants float32,float16,dynamic,int8
+    python convert_to_tflite.py --dataset tags/ --min-top1-agreement 0.99 --report conversion_report.json
 """
 
+import argparse
+import json
+import os
+import random
+import time
+
 import tensorflow as tf
 
+from predict import decode_image, fill_input
+
+VARIANTS = ("float32", "float16", "dynamic", "int8")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
 # Path to your existing .keras model
-keras_model_path = "care_symbols_model_20251009_233516.keras"
-tflite_model_path = "care_symbols_model.tflite"
+DEFAULT_KERAS_MODEL = "care_symbols_model_20251009_233516.keras"
+
+
+def list_images(dataset_dir):
+    """Image files under dataset_dir, in a stable order"""
+    paths = []
+    for root, _, files in os.walk(dataset_dir):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+
+def load_pixels(paths, input_size):
+    """
+    Decode images the way predict.py does: uint8 RGB at the model input size.
+
+    Files that cannot be read or decoded are skipped, like bulk_label.py does.
+
+    Returns:
+        (pixels, skipped) - stacked images and the number of files skipped
+    """
+    import numpy as np
+
+    arrays = []
+    skipped = 0
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                arrays.append(decode_image(f.read(), input_size))
+        except Exception as e:
+            print(f"  Skipping {path}: {str(e)}")
+            skipped += 1
+    pixels = np.stack(arrays) if arrays else np.zeros((0, input_size[1], input_size[0], 3), np.uint8)
+    return pixels, skipped
+
+
+def convert(model, variant, calibration=None):
+    """Return the TFLite flatbuffer for one variant"""
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+
+    if variant == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == "dynamic":
+        # Optional: Optimize for size
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    elif variant == "int8":
+        if calibration is None or not len(calibration):
+            raise ValueError("int8 needs a representative dataset (--dataset)")
+
+        def representative_dataset():
+            # Same 0-1 scaling as the float models; predict.py applies
+            # whatever input scale and zero point calibration settles on
+            for pixels in calibration:
+                yield [pixels[None].astype("float32") / 255.0]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.uint8
+        converter.inference_output_type = tf.uint8
+
+    return converter.convert()
+
+
+def run_tflite(interpreter, pixels):
+    """Invoke on one uint8 image, feeding and reading tensors like predict.py"""
+    import numpy as np
+
+    input_detail = interpreter.get_input_details()[0]
+    output_detail = interpreter.get_output_details()[0]
+    data = np.empty(input_detail["shape"], input_detail["dtype"])
+    fill_input(data[0], pixels, input_detail["quantization"])
+    interpreter.set_tensor(input_detail["index"], data)
+    interpreter.invoke()
+
+    output = interpreter.get_tensor(output_detail["index"])[0]
+    scale, zero_point = output_detail["quantization"]
+    if scale and output.dtype.kind in "iu":
+        output = (output.astype(np.float32) - zero_point) * scale
+    return output
+
+
+def top_k_sets(scores, k):
+    import numpy as np
+    return [set(row) for row in np.argsort(-scores, axis=1)[:, :k]]
+
+
+def evaluate(variant, path, validation, reference, top_k, latency_images):
+    """Size, load time, latency and agreement with the Keras reference scores"""
+    import numpy as np
+
+    load_start = time.perf_counter()
+    interpreter = tf.lite.Interpreter(model_path=path, num_threads=1)
+    interpreter.allocate_tensors()
+    load_ms = (time.perf_counter() - load_start) * 1000
+
+    input_detail = interpreter.get_input_details()[0]
+    result = {
+        "variant": variant,
+        "path": path,
+        "sizeBytes": os.path.getsize(path),
+        "loadMs": round(load_ms, 2),
+        "inputDtype": np.dtype(input_detail["dtype"]).name,
+        "outputDtype": np.dtype(interpreter.get_output_details()[0]["dtype"]).name,
+    }
+
+    if input_detail["dtype"] != np.float32:
+        scale, zero_point = input_detail["quantization"]
+        result["inputQuantization"] = {"scale": scale, "zeroPoint": zero_point}
+
+    if not len(validation):
+        return result
+
+    # Warm up the first-invoke kernel setup before timing
+    run_tflite(interpreter, validation[0])
+    cpu_times = []
+    scores = []
+    for i, pixels in enumerate(validation):
+        cpu_start = time.process_time()
+        scores.append(run_tflite(interpreter, pixels))
+        if i < latency_images:
+            cpu_times.append((time.process_time() - cpu_start) * 1000)
+    scores = np.stack(scores)
+    cpu_times.sort()
+
+    top1 = float(np.mean(np.argmax(scores, axis=1) == np.argmax(reference, axis=1)))
+    overlap = [
+        len(ours & theirs) / float(top_k)
+        for ours, theirs in zip(top_k_sets(scores, top_k), top_k_sets(reference, top_k))
+    ]
+    result.update({
+        "cpuMsPerImage": round(cpu_times[len(cpu_times) // 2], 3),
+        "top1Agreement": round(top1, 4),
+        f"top{top_k}Agreement": round(float(np.mean(overlap)), 4),
+        "meanAbsScoreDiff": round(float(np.mean(np.abs(scores - reference))), 5),
+    })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keras", default=DEFAULT_KERAS_MODEL, help="Keras model to convert")
+    parser.add_argument("--output-dir", default=".", help="Where to write the .tflite variants")
+    parser.add_argument("--name", default="care_symbols_model", help="Output file name prefix")
+    parser.add_argument("--variants", default="dynamic",
+                        help=f"Comma-separated subset of {','.join(VARIANTS)} (default: dynamic)")
+    parser.add_argument("--dataset", help="Directory of tag images for int8 calibration and validation")
+    parser.add_argument("--calibration-images", type=int, default=200)
+    parser.add_argument("--validation-images", type=int, default=200)
+    parser.add_argument("--latency-images", type=int, default=50, help="Images timed per variant")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--min-top1-agreement", type=float, default=0.98,
+                        help="Accuracy budget: least top-1 agreement with Keras to be recommended")
+    parser.add_argument("--min-topk-agreement", type=float, default=0.95,
+                        help="Accuracy budget: least top-k overlap with Keras to be recommended")
+    parser.add_argument("--report", default="conversion_report.json")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.latency_images < 1:
+        parser.error("--latency-images must be at least 1")
+
+    variants = [v.strip() for v in args.variants.split(",") if v.strip()]
+    unknown = set(variants) - set(VARIANTS)
+    if unknown:
+        parser.error(f"Unknown variants: {', '.join(sorted(unknown))}")
+
+    print(f"Loading {args.keras}...")
+    model = tf.keras.models.load_model(args.keras)
+    # Shape is [batch, height, width, channels]; PIL sizes are (width, height)
+    input_size = (int(model.input_shape[2]), int(model.input_shape[1]))
 
-print(f"Loading {keras_model_path}...")
-model = tf.keras.models.load_model(keras_model_path)
+    # Calibration and validation images are disjoint samples of the dataset
+    calibration, validation = [], []
+    skipped = 0
+    if args.dataset:
+        paths = list_images(args.dataset)
+        random.Random(args.seed).shuffle(paths)
+        calibration_paths = paths[:args.calibration_images]
+        validation_paths = paths[args.calibration_images:args.calibration_images + args.validation_images]
+        print(f"Decoding {len(calibration_paths)} calibration and {len(validation_paths)} validation images...")
+        calibration, skipped = load_pixels(calibration_paths, input_size)
+        if validation_paths:
+            validation, validation_skipped = load_pixels(validation_paths, input_size)
+            skipped += validation_skipped
+        else:
+            # Small dataset: validate on the calibration images rather than nothing
+            validation = calibration[:args.validation_images]
+        if skipped:
+            print(f"Skipped {skipped} unreadable images")
+    else:
+        print("No --dataset: skipping validation (and int8, which needs calibration images)")
+        variants = [v for v in variants if v != "int8"]
 
-print("Converting to TFLite...")
-converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    reference = model.predict(validation.astype("float32") / 255.0, verbose=0) if len(validation) else None
 
-# Optional: Optimize for size
-converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    os.makedirs(args.output_dir, exist_ok=True)
+    results = []
+    for variant in variants:
+        print(f"Converting to TFLite ({variant})...")
+        tflite_model = convert(model, variant, calibration)
+        # The default variant keeps the plain file name the function docs use
+        suffix = "" if variant == "dynamic" else f"_{variant}"
+        path = os.path.join(args.output_dir, f"{args.name}{suffix}.tflite")
+        with open(path, 'wb') as f:
+            f.write(tflite_model)
 
-# Convert
-tflite_model = converter.convert()
+        result = evaluate(variant, path, validation, reference, args.top_k, args.latency_images)
+        results.append(result)
+        print(f"✓ {path}: {result['sizeBytes'] / 1024 / 1024:.2f} MB"
+              + (f", {result['cpuMsPerImage']} ms/image CPU, top-1 agreement {result['top1Agreement']:.2%}"
+                 if "top1Agreement" in result else ""))
 
-# Save
-with open(tflite_model_path, 'wb') as f:
-    f.write(tflite_model)
+    topk_key = f"top{args.top_k}Agreement"
+    within_budget = [
+        r for r in results
+        if "top1Agreement" in r
+        and r["top1Agreement"] >= args.min_top1_agreement
+        and r[topk_key] >= args.min_topk_agreement
+    ]
+    recommended = min(within_budget, key=lambda r: r["cpuMsPerImage"]) if within_budget else None
 
-print(f"✓ Model converted successfully: {tflite_model_path}")
-print(f"  Size: {len(tflite_model) / 1024 / 1024:.2f} MB")
+    report = {
+        "kerasModel": args.keras,
+        "inputSize": list(input_size),
+        "calibrationImages": len(calibration),
+        "validationImages": len(validation),
+        "skippedImages": skipped,
+        "budget": {"minTop1Agreement": args.min_top1_agreement, f"minTop{args.top_k}Agreement": args.min_topk_agreement},
+        "variants": results,
+        "recommended": recommended["variant"] if recommended else None,
+    }
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.report}")
 
-# Test the model
-print("\nTesting TFLite model...")
-interpreter = tf.lite.Interpreter(model_path=tflite_model_path)
-interpreter.allocate_tensors()
+    if recommended:
+        print(f"Recommended: {recommended['variant']} ({recommended['path']})")
+    elif len(validation):
+        print("No variant met the accuracy budget")
 
-input_details = interpreter.get_input_details()
-output_details = interpreter.get_output_details()
+    print(f"\nNext steps:")
+    print(f"1. Upload {recommended['path'] if recommended else 'the chosen .tflite file'} to Appwrite Storage")
+    print(f"2. Update MODEL_FILE_ID environment variable")
+    print(f"3. Deploy the updated function with requirements.txt")
 
-print(f"✓ TFLite model validated")
-print(f"  Input shape: {input_details[0]['shape']}")
-print(f"  Output shape: {output_details[0]['shape']}")
 
-print(f"\nNext steps:")
-print(f"1. Upload {tflite_model_path} to Appwrite Storage")
-print(f"2. Update MODEL_FILE_ID environment variable")
-print(f"3. Deploy the updated function with requirements.txt")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Import-time profiling for cold starts.
+With IMPORT_PROFILE=true, every module imported after this one is timed,
+like `python -X importtime`: cumulative milliseconds (including the modules
+it pulled in) and self milliseconds. That covers the lazy imports too: the
+TFLite runtime, numpy and PIL show up when the first request loads them.
+{"action": "stats"} reports the slowest modules under startup.imports.
+main.py imports this module before any other, so all of its imports are
+timed; the few standard modules this one needs are loaded at interpreter
+startup anyway.
+Without IMPORT_PROFILE nothing is hooked and imports cost what they always did.
+"""
+
+import builtins
+import importlib.util
+import os
+import sys
+import threading
+import time
+
+# Modules listed in the stats report, slowest cumulative first
+REPORT_LIMIT = 30
+
+_records = {}           # module name -> {"cumulativeMs", "selfMs", "thread"}
+_records_lock = threading.Lock()
+_local = threading.local()
+_original_import = builtins.__import__
+_installed = False
+
+
+def _resolve(name, globals, level):
+    """Absolute module name of an import statement, or None if it can't be told"""
+    if not level:
+        return name
+    package = (globals or {}).get("__package__")
+    if not package:
+        return None
+    try:
+        return importlib.util.resolve_name("." * level + name, package)
+    except (ImportError, ValueError):
+        return None
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    module_name = _resolve(name, globals, level)
+    if not module_name or module_name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    # Time spent in nested imports is subtracted to get self time
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(0.0)
+    started = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        children_ms = stack.pop()
+        if stack:
+            stack[-1] += elapsed_ms
+        with _records_lock:
+            if module_name not in _records:
+                _records[module_name] = {
+                    "cumulativeMs": round(elapsed_ms, 3),
+                    "selfMs": round(elapsed_ms - children_ms, 3),
+                    "thread": threading.current_thread().name,
+                }
+
+
+def enabled():
+    return os.environ.get("IMPORT_PROFILE", "").lower() in ("1", "true", "yes")
+
+
+def install():
+    """Start timing imports; a no-op when already installed"""
+    global _installed
+    if not _installed:
+        builtins.__import__ = _timed_import
+        _installed = True
+
+
+def report(limit=REPORT_LIMIT):
+    """
+    Slowest imports so far, or None when profiling is off.
+
+    Returns:
+        Dict with 'modules' (the `limit` slowest by cumulative time) and
+        'count', the number of modules timed
+    """
+    if not _installed:
+        return None
+    with _records_lock:
+        records = [dict(record, module=name) for name, record in _records.items()]
+    records.sort(key=lambda r: r["cumulativeMs"], reverse=True)
+    return {"count": len(records), "modules": records[:limit]}
+
+
+if enabled():
+    install()
@@ -0,0 +1,183 @@
+"""
+Images sent in the request itself instead of by Storage fileId.
+Small tag crops can be posted as base64 in the JSON payload ("image") or as
+the "image" part of a multipart/form-data body. That skips the client upload
+and the function's download of the same bytes. Inline images are capped at
+MAX_INLINE_IMAGE_BYTES, and the cap is checked before anything is decoded.
+Persisting an inline image to Storage is optional and happens in the
+background after the response is built.
+"""
+
+import base64
+import binascii
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Import with package-relative import for Appwrite Open Runtimes
+try:
+    from .appwrite_http import appwrite_post
+    from .predict import ImageRejected
+    from .telemetry import increment, log
+except ImportError:
+    from appwrite_http import appwrite_post
+    from predict import ImageRejected
+    from telemetry import increment, log
+
+# Allowance for multipart boundaries, part headers and the other form fields
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+
+# Extensions for the persisted copy, by PIL format name
+FILE_EXTENSIONS = {"JPEG": "jpg", "MPO": "jpg", "PNG": "png", "WEBP": "webp",
+                   "GIF": "gif", "BMP": "bmp", "TIFF": "tiff"}
+
+# Background uploads; kept small so persistence never competes with inference
+_persist_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="persist")
+
+
+def inline_image_limit():
+    """Largest accepted inline image in bytes (MAX_INLINE_IMAGE_BYTES, default 1 MB)"""
+    return int(os.environ.get("MAX_INLINE_IMAGE_BYTES") or 1024 * 1024)
+
+
+def decode_base64_image(data):
+    """
+    Decode a base64 image string, with or without a data: URL prefix.
+
+    Raises:
+        ImageRejected: Encoded size over the limit, or not valid base64
+    """
+    if not isinstance(data, str):
+        raise ImageRejected("Inline image must be a base64 string")
+    if data.startswith("data:"):
+        data = data.partition(",")[2]
+
+    limit = inline_image_limit()
+    # Every 4 base64 characters carry 3 bytes; check before decoding anything
+    if len(data) * 3 // 4 > limit + 2:
+        raise ImageRejected(f"Inline image too large: more than {limit} bytes")
+
+    try:
+        image_bytes = base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError):
+        raise ImageRejected("Inline image is not valid base64")
+    if len(image_bytes) > limit:
+        raise ImageRejected(f"Inline image too large: {len(image_bytes)} bytes exceeds {limit}")
+    return image_bytes
+
+
+def _form_value(text):
+    """Form fields arrive as text; read numbers and booleans as JSON"""
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def parse_multipart(body, content_type):
+    """
+    Split a multipart/form-data body into form fields and the image part.
+
+    Returns:
+        Tuple of (dict of other fields, image bytes or None)
+
+    Raises:
+        ImageRejected: Body larger than the inline limit allows
+    """
+    from email.parser import BytesParser
+    from email.policy import HTTP
+
+    limit = inline_image_limit()
+    if len(body) > limit + MULTIPART_OVERHEAD_BYTES:
+        raise ImageRejected(f"Inline image too large: more than {limit} bytes")
+
+    message = BytesParser(policy=HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body
+    )
+    if not message.is_multipart():
+        raise ValueError("Malformed multipart body")
+
+    fields = {}
+    image_bytes = None
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        content = part.get_payload(decode=True) or b""
+        if name == "image":
+            image_bytes = content
+        elif name:
+            fields[name] = _form_value(content.decode("utf-8", "replace"))
+
+    if image_bytes is not None and len(image_bytes) > limit:
+        raise ImageRejected(f"Inline image too large: {len(image_bytes)} bytes exceeds {limit}")
+    return fields, image_bytes
+
+
+def read_request(req):
+    """
+    Parse the request body into a payload dict and optional inline image.
+
+    JSON bodies may carry a base64 "image"; multipart bodies carry the image
+    as a file part named "image" and the other parameters as form fields.
+
+    Returns:
+        Tuple of (payload dict, image bytes or None)
+
+    Raises:
+        json.JSONDecodeError: Body is not valid JSON
+        ImageRejected: Inline image too large or not decodable as base64
+    """
+    headers = {k.lower(): v for k, v in (getattr(req, "headers", None) or {}).items()}
+    content_type = headers.get("content-type", "")
+
+    if content_type.startswith("multipart/form-data"):
+        # Binary-safe body where the runtime provides one
+        body = getattr(req, "body_binary", None)
+        if body is None:
+            body = req.body if isinstance(req.body, bytes) else (req.body or "").encode("utf-8", "surrogateescape")
+        return parse_multipart(body, content_type)
+
+    if req.body:
+        payload = json.loads(req.body)
+    else:
+        payload = {}
+
+    image_bytes = None
+    if payload.get("image") is not None:
+        image_bytes = decode_base64_image(payload.pop("image"))
+    return payload, image_bytes
+
+
+def new_file_id():
+    """Storage file ID generated up front, so the response can reference it"""
+    from appwrite.id import ID
+    return ID.unique()
+
+
+def _upload(bucket_id, file_id, image_bytes, image_format):
+    filename = f"{file_id}.{FILE_EXTENSIONS.get(image_format, 'bin')}"
+    try:
+        response = appwrite_post(
+            f"/storage/buckets/{bucket_id}/files",
+            "upload",
+            data={"fileId": file_id},
+            files={"file": (filename, image_bytes, f"image/{filename.rsplit('.', 1)[1]}")},
+        )
+        response.raise_for_status()
+        increment("persist.stored")
+        log(f"Persisted inline image as {file_id}")
+    except Exception as e:
+        increment("persist.failed")
+        log(f"Failed to persist inline image {file_id}: {str(e)}", "ERROR")
+
+
+def persist_image_async(bucket_id, file_id, image_bytes, image_format):
+    """
+    Upload an inline image to Storage in the background.
+
+    Best effort: failures are logged and counted as persist.failed, never
+    surfaced to the request that supplied the image.
+
+    Returns:
+        Future for the upload
+    """
+    return _persist_executor.submit(_upload, bucket_id, file_id, image_bytes, image_format)
@@ -4,22 +4,43 @@ Accepts an uploaded image file ID, runs TensorFlow inference, and enriches resul
 with care symbol metadata from the Appwrite database.
 """
 
+import time
+
+# Start of the module import, for the cold-start budget in stats
+_import_started = time.perf_counter()
+
+# Before every other import, so IMPORT_PROFILE times all of them
+try:
+    from . import import_profile
+except ImportError:
+    import import_profile
+
 import os
 import json
-import sys
-from appwrite.client import Client
-from appwrite.query import Query
+import hashlib
+import random
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 
 # Import with package-relative import for Appwrite Open Runtimes
 try:
     from .predict import CareSymbolPredictor  # when loaded as package "function"
+    from .predict import CLASS_NAMES, ModelBudgetExceeded, ModelCascade, cascade_stats
+    from .predict import ImageRejected, check_image_header, image_limits, import_runtime, tile_settings
+    from .predict import assess_quality, quality_issues, quality_thresholds
+    from .result_cache import ResultCache, get_result_cache
+    from .appwrite_http import appwrite_get, connection_stats
+    from .inline_image import new_file_id, persist_image_async, read_request
+    from .telemetry import Timings, increment, log, observe, snapshot
 except ImportError:
     from predict import CareSymbolPredictor   # fallback for local runs
-
-
-def log(message, level="INFO"):
-    """Simple logging helper"""
-    print(f"[{level}] {message}", file=sys.stderr, flush=True)
+    from predict import CLASS_NAMES, ModelBudgetExceeded, ModelCascade, cascade_stats
+    from predict import ImageRejected, check_image_header, image_limits, import_runtime, tile_settings
+    from predict import assess_quality, quality_issues, quality_thresholds
+    from result_cache import ResultCache, get_result_cache
+    from appwrite_http import appwrite_get, connection_stats
+    from inline_image import new_file_id, persist_image_async, read_request
+    from telemetry import Timings, increment, log, observe, snapshot
 
 
 def get_env_var(key, required=True):
@@ -30,61 +51,336 @@ def get_env_var(key, required=True):
     return value
 
 
-def init_appwrite_client():
-    """Initialize Appwrite client with credentials from environment"""
-    endpoint = get_env_var("APPWRITE_ENDPOINT")
-    project_id = get_env_var("APPWRITE_PROJECT_ID")
-    api_key = get_env_var("APPWRITE_API_KEY")
+def check_appwrite_config():
+    """
+    Fail fast on missing Appwrite credentials. Every call goes through
+    appwrite_http, so the SDK client (and the requests import it drags in
+    at module load) is never needed.
+    """
+    for key in ("APPWRITE_ENDPOINT", "APPWRITE_PROJECT_ID", "APPWRITE_API_KEY"):
+        get_env_var(key)
+
+
+def query(method, *values):
+    """
+    An attribute-free Appwrite list query (limit, offset, ...), serialized
+    exactly as the SDK's Query helpers do, e.g.
+    query("limit", 100) == '{"method":"limit","values":[100]}'.
+    """
+    return json.dumps({"method": method, "values": list(values)}, separators=(",", ":"))
 
-    client = Client()
-    client.set_endpoint(endpoint)
-    client.set_project(project_id)
-    client.set_key(api_key)
 
-    return client
+# Streaming chunk size, and how much of the file to read before the first header check
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+HEADER_PROBE_BYTES = 64 * 1024
 
 
-def download_image(client, bucket_id, file_id):
-    """Download image bytes from Appwrite Storage using direct HTTP call"""
-    log(f"Downloading file {file_id} from bucket {bucket_id}")
+def stream_image(path, params=None):
+    """
+    Stream an image from an Appwrite Storage path with bounded memory.
 
-    try:
-        # Direct HTTP request to avoid SDK bug with GET requests
-        import requests
-        import hashlib
-        endpoint = os.environ.get("APPWRITE_ENDPOINT")
-        project_id = os.environ.get("APPWRITE_PROJECT_ID")
-        api_key = os.environ.get("APPWRITE_API_KEY")
-
-        url = f"{endpoint}/storage/buckets/{bucket_id}/files/{file_id}/download"
-        headers = {
-            "X-Appwrite-Project": project_id,
-            "X-Appwrite-Key": api_key
-        }
+    Chunks are hashed as they arrive, the download is aborted once it exceeds
+    MAX_IMAGE_BYTES, and the image header is checked after the first chunks
+    so unsupported formats or absurd pixel dimensions are rejected before the
+    rest of the file is transferred.
+
+    Returns:
+        Tuple of (image bytes, SHA-256 hex digest of the bytes)
+
+    Raises:
+        ImageRejected: File too large, unsupported format or too many pixels
+    """
+    max_bytes, max_pixels = image_limits()
 
-        response = requests.get(url, headers=headers)
+    # Direct HTTP request to avoid SDK bug with GET requests,
+    # through the shared pooled session
+    with appwrite_get(path, "image", params=params, stream=True) as response:
         response.raise_for_status()
 
-        content = response.content
-        # Log hash to verify we're getting different images
-        content_hash = hashlib.md5(content).hexdigest()
-        log(f"Downloaded {len(content)} bytes, MD5: {content_hash[:8]}")
+        declared = int(response.headers.get("Content-Length") or 0)
+        if declared > max_bytes:
+            raise ImageRejected(f"Image too large: {declared} bytes exceeds {max_bytes}")
+
+        hasher = hashlib.sha256()
+        chunks = []
+        size = 0
+        header = None
+        next_probe = HEADER_PROBE_BYTES
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+            size += len(chunk)
+            if size > max_bytes:
+                raise ImageRejected(f"Image too large: more than {max_bytes} bytes")
+            hasher.update(chunk)
+            chunks.append(chunk)
+
+            if header is None and size >= next_probe:
+                header = check_image_header(b"".join(chunks), max_pixels)
+                next_probe *= 4
+
+    content = b"".join(chunks)
+    if header is None:
+        header = check_image_header(content, max_pixels, complete=True)
+
+    # Content hash keys the result cache and shows we're getting different images
+    content_hash = hasher.hexdigest()
+    log(f"Downloaded {len(content)} bytes ({header[0]} {header[1][0]}x{header[1][1]}), "
+        f"SHA-256: {content_hash[:8]}")
+
+    return content, content_hash
+
+
+def preview_params():
+    """
+    Query parameters for a server-resized rendition sized for the model.
+
+    Only the width is constrained, so the preview keeps the photo's aspect
+    ratio instead of being cropped. The width is PREVIEW_SCALE (default 4)
+    times the model's input width, which leaves enough vertical resolution
+    for wide care labels. Before the model is loaded, 224 is assumed.
+    """
+    input_size = CareSymbolPredictor.input_size() or (224, 224)
+    scale = float(get_env_var("PREVIEW_SCALE", required=False) or 4)
+    quality = int(get_env_var("PREVIEW_QUALITY", required=False) or 85)
+    return {
+        "width": min(4000, int(input_size[0] * scale)),
+        "quality": quality,
+        "output": "jpg",
+    }
+
+
+def download_image(bucket_id, file_id, preview=False):
+    """
+    Download image bytes from Appwrite Storage using direct HTTP call.
+
+    With preview=True, a server-downscaled JPEG is fetched from the Storage
+    preview endpoint instead of the full-resolution original, falling back to
+    the original if the preview is unavailable.
+
+    Returns:
+        Tuple of (image bytes, SHA-256 hex digest of the bytes)
+
+    Raises:
+        ImageRejected: File too large, unsupported format or too many pixels
+    """
+    log(f"Downloading file {file_id} from bucket {bucket_id}{' (preview)' if preview else ''}")
+    file_path = f"/storage/buckets/{bucket_id}/files/{file_id}"
+
+    if preview:
+        try:
+            result = stream_image(f"{file_path}/preview", params=preview_params())
+            increment("preview.used")
+            return result
+        except Exception as e:
+            log(f"Preview unavailable for {file_id}, downloading original: {str(e)}", "WARN")
+            increment("preview.fallbacks")
 
-        return content
+    try:
+        return stream_image(f"{file_path}/download")
     except Exception as e:
         log(f"Failed to download image: {str(e)}", "ERROR")
         raise
 
 
-def enrich_predictions(database_id, collection_id, predictions):
+# Symbol metadata catalog, cached at module level so it survives warm invocations
+_metadata_cache = {
+    "key": None,        # (database_id, collection_id) the catalog was fetched for
+    "by_title": {},     # title -> document
+    "fetched_at": 0.0,  # time.monotonic() of the last successful fetch
+}
+_metadata_lock = threading.Lock()
+
+# Appwrite caps list queries at 100 documents per page
+METADATA_PAGE_SIZE = 100
+
+
+def invalidate_metadata_cache():
+    """Drop the cached symbol metadata so the next lookup refetches it"""
+    with _metadata_lock:
+        _metadata_cache["key"] = None
+        _metadata_cache["by_title"] = {}
+        _metadata_cache["fetched_at"] = 0.0
+    log("Symbol metadata cache invalidated")
+
+
+def fetch_metadata_catalog(database_id, collection_id, timings=None):
+    """
+    Fetch the whole care_symbols collection in as few queries as possible.
+
+    The collection is small (~39 rows), so this is normally a single request.
+    Larger collections are paged through with limit/offset.
+
+    Returns:
+        Dict mapping document title to document
+    """
+    timings = timings or Timings()
+    path = f"/databases/{database_id}/collections/{collection_id}/documents"
+
+    by_title = {}
+    offset = 0
+    while True:
+        params = [
+            ("queries[]", query("limit", METADATA_PAGE_SIZE)),
+            ("queries[]", query("offset", offset))
+        ]
+
+        with timings.span("enrich_query"):
+            response = appwrite_get(path, "metadata", params=params)
+        response.raise_for_status()
+
+        data = response.json()
+        docs = data.get("documents", [])
+        for doc in docs:
+            if doc.get("title"):
+                by_title[doc["title"]] = doc
+
+        offset += len(docs)
+        if not docs or offset >= data.get("total", 0):
+            break
+
+    log(f"Fetched {len(by_title)} documents from database")
+    return by_title
+
+
+def get_metadata_catalog(database_id, collection_id, timings=None):
+    """
+    Return the symbol metadata catalog, fetching it only when the cache is
+    empty, expired (METADATA_CACHE_TTL seconds, default 600) or was built
+    for a different collection. If a refetch fails, the stale catalog is
+    served rather than dropping enrichment altogether.
+    """
+    ttl = float(get_env_var("METADATA_CACHE_TTL", required=False) or 600)
+    key = (database_id, collection_id)
+
+    with _metadata_lock:
+        age = time.monotonic() - _metadata_cache["fetched_at"]
+        if _metadata_cache["key"] == key and age < ttl:
+            increment("metadata_cache.hits")
+            return _metadata_cache["by_title"]
+
+        increment("metadata_cache.misses")
+        try:
+            by_title = fetch_metadata_catalog(database_id, collection_id, timings)
+        except Exception as e:
+            if _metadata_cache["key"] == key:
+                log(f"Metadata refresh failed, serving stale catalog: {str(e)}", "WARN")
+                return _metadata_cache["by_title"]
+            raise
+
+        _metadata_cache["key"] = key
+        _metadata_cache["by_title"] = by_title
+        _metadata_cache["fetched_at"] = time.monotonic()
+        return by_title
+
+
+# Fields a symbol carries besides its title, in responses and the bundle
+METADATA_FIELDS = ("shortDescription", "dos", "donts", "image", "category")
+
+# Class index by label, for compact results
+CLASS_INDEX = {title: index for index, title in enumerate(CLASS_NAMES)}
+
+# Bundle built from the current catalog; rebuilt when the catalog is refetched
+_bundle_cache = {"catalog": None, "bundle": None}
+
+
+def get_metadata_bundle(database_id, collection_id, timings=None):
+    """
+    The whole label metadata table in model class order, with a version tag.
+
+    The version is a hash of the table's content, so it changes exactly when
+    the catalog or the class list does. Compact responses carry it and
+    clients refetch the bundle only when theirs differs.
+
+    Returns:
+        Dict with 'version' and 'symbols' (one entry per class index)
+    """
+    by_title = get_metadata_catalog(database_id, collection_id, timings)
+    with _metadata_lock:
+        if _bundle_cache["catalog"] is by_title:
+            return _bundle_cache["bundle"]
+
+    symbols = []
+    for index, title in enumerate(CLASS_NAMES):
+        doc = by_title.get(title, {})
+        symbols.append(dict(
+            {"index": index, "title": title},
+            **{field: doc.get(field, "") for field in METADATA_FIELDS}
+        ))
+    canonical = json.dumps(symbols, sort_keys=True, separators=(",", ":"))
+    bundle = {
+        "version": hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16],
+        "symbols": symbols
+    }
+
+    with _metadata_lock:
+        _bundle_cache["catalog"] = by_title
+        _bundle_cache["bundle"] = bundle
+    return bundle
+
+
+def metadata_response(headers):
+    """
+    Serve the metadata bundle for GET /metadata with HTTP caching.
+
+    The ETag is the bundle version; a matching If-None-Match gets 304 and no
+    body, so clients revalidate for the cost of a header exchange.
+
+    Returns:
+        Tuple of (status, response dict or None, response headers)
+    """
+    headers = {k.lower(): v for k, v in (headers or {}).items()}
+    try:
+        bundle = get_metadata_bundle(get_env_var("DATABASE_ID"), get_env_var("COLLECTION_ID"))
+    except ValueError as e:
+        return 500, {"success": False, "error": f"Configuration error: {str(e)}"}, {}
+    except Exception as e:
+        log(f"Error fetching symbol metadata: {str(e)}", "ERROR")
+        return 502, {"success": False, "error": f"Failed to fetch symbol metadata: {str(e)}"}, {}
+
+    etag = f'"{bundle["version"]}"'
+    ttl = int(float(get_env_var("METADATA_CACHE_TTL", required=False) or 600))
+    response_headers = {"ETag": etag, "Cache-Control": f"public, max-age={ttl}"}
+
+    if_none_match = headers.get("if-none-match", "")
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if if_none_match.strip() == "*" or etag in tags:
+        increment("metadata.not_modified")
+        return 304, None, response_headers
+    return 200, dict(bundle, success=True), response_headers
+
+
+def compact_predictions(predictions):
+    """Class index, label and confidence only; clients look up the rest in the bundle"""
+    return [
+        {
+            # Entries cached before classIndex existed fall back to the label
+            "index": pred.get("classIndex", CLASS_INDEX.get(pred["label"])),
+            "label": pred["label"],
+            "confidence": round(pred["confidence"], 4)
+        }
+        for pred in predictions
+    ]
+
+
+def metadata_version(database_id, collection_id, timings=None):
+    """Version of the metadata bundle, or None if the catalog is unavailable"""
+    try:
+        return get_metadata_bundle(database_id, collection_id, timings)["version"]
+    except Exception as e:
+        log(f"Error fetching symbol metadata: {str(e)}", "WARN")
+        return None
+
+
+def enrich_predictions(database_id, collection_id, predictions, timings=None):
     """
-    Query Appwrite database for predicted labels and enrich with metadata.
-    Uses direct HTTP requests to avoid SDK bug. Fetches all docs once for efficiency.
+    Enrich predicted labels with metadata from the care_symbols collection.
+    The whole catalog is fetched in one query and cached across warm
+    invocations (see get_metadata_catalog), so label lookups are dict hits.
 
     Args:
         database_id: Database ID
         collection_id: Collection ID for care_symbols
         predictions: List of dicts with 'label' and 'confidence'
+        timings: Optional telemetry.Timings to record enrichment queries into
 
     Returns:
         List of enriched results with title, confidence, shortDescription, dos, donts, image, category
@@ -94,45 +390,11 @@ def enrich_predictions(database_id, collection_id, predictions):
     if not predictions:
         return []
 
-    # Get credentials for direct HTTP calls
-    import requests
-    endpoint = os.environ.get("APPWRITE_ENDPOINT")
-    project_id = os.environ.get("APPWRITE_PROJECT_ID")
-    api_key = os.environ.get("APPWRITE_API_KEY")
-
-    # Fetch documents one by one (simple and reliable)
-    url = f"{endpoint}/databases/{database_id}/collections/{collection_id}/documents"
-    headers = {
-        "X-Appwrite-Project": project_id,
-        "X-Appwrite-Key": api_key
-    }
-
-    by_title = {}
-    for pred in predictions:
-        label = pred["label"]
-        try:
-            # Use Query class to build proper query string
-            query_str = Query.equal("title", [label])
-            limit_str = Query.limit(1)
-
-            params = [
-                ("queries[]", query_str),
-                ("queries[]", limit_str)
-            ]
-
-            response = requests.get(url, headers=headers, params=params, timeout=10)
-            response.raise_for_status()
-
-            data = response.json()
-            docs = data.get("documents", [])
-            if docs:
-                by_title[label] = docs[0]
-                log(f"Found metadata for '{label}'")
-        except Exception as e:
-            log(f"Error querying for '{label}': {str(e)}", "WARN")
-            continue
-
-    log(f"Fetched {len(by_title)} documents from database")
+    try:
+        by_title = get_metadata_catalog(database_id, collection_id, timings)
+    except Exception as e:
+        log(f"Error fetching symbol metadata: {str(e)}", "WARN")
+        by_title = {}
 
     # Now build enriched results
     enriched_results = []
@@ -142,117 +404,828 @@ def enrich_predictions(database_id, collection_id, predictions):
 
         doc = by_title.get(label)
         if doc:
-            enriched_results.append({
-                "title": doc.get("title", label),
-                "confidence": confidence,
-                "shortDescription": doc.get("shortDescription", ""),
-                "dos": doc.get("dos", ""),
-                "donts": doc.get("donts", ""),
-                "image": doc.get("image", ""),
-                "category": doc.get("category", "")
-            })
+            enriched_results.append(dict(
+                {"title": doc.get("title", label), "confidence": confidence},
+                **{field: doc.get(field, "") for field in METADATA_FIELDS}
+            ))
             log(f"Enriched '{label}' (confidence: {confidence:.3f})")
         else:
             # No match found, return basic info
             log(f"No database match for '{label}', returning basic info", "WARN")
-            enriched_results.append({
-                "title": label,
-                "confidence": confidence,
-                "shortDescription": "",
-                "dos": "",
-                "donts": "",
-                "image": "",
-                "category": ""
-            })
+            enriched_results.append(dict(
+                {"title": label, "confidence": confidence},
+                **{field: "" for field in METADATA_FIELDS}
+            ))
 
     return enriched_results
 
 
-def main(context):
+def download_images(bucket_id, file_ids, max_workers=8, preview=False):
     """
-    Appwrite Function entrypoint
+    Download several images from Appwrite Storage concurrently.
 
-    Expected payload: { "fileId": "..." }
-    Optional: { "fileId": "...", "topK": 5, "threshold": 0.1 }
+    Returns:
+        List with one entry per file ID, in order. Each entry is either the
+        (image bytes, content hash) tuple or the exception raised while
+        downloading that file.
+    """
+    def _download(file_id):
+        try:
+            return download_image(bucket_id, file_id, preview=preview)
+        except Exception as e:
+            return e
 
-    Returns: { "success": true, "results": [...] }
+    workers = max(1, min(max_workers, len(file_ids)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_download, file_ids))
+
+
+# Shared across invocations so warm requests don't pay for thread startup.
+# Created on first use, so a host process can set STAGE_CONCURRENCY first.
+_stage_executor = None
+_stage_executor_lock = threading.Lock()
+
+
+def stage_executor():
+    """Thread pool for request stages, sized by STAGE_CONCURRENCY (default 4)"""
+    global _stage_executor
+    with _stage_executor_lock:
+        if _stage_executor is None:
+            workers = max(1, int(get_env_var("STAGE_CONCURRENCY", required=False) or 4))
+            _stage_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stage")
+        return _stage_executor
+
+
+def run_stages_concurrently(stages, timings):
     """
+    Run independent I/O-bound stages at the same time and wait for all of them.
+
+    The last stage runs on the calling thread and the others on the shared
+    stage pool, so a request only holds len(stages) - 1 pool threads. Each
+    stage is timed under its own name. The wall time of the whole group
+    is recorded as 'parallel_wall' and the time saved versus running the
+    stages back to back as 'overlap_saved'.
+
+    Args:
+        stages: Dict of stage name -> zero-argument callable
+        timings: telemetry.Timings for this request
+
+    Returns:
+        Dict of stage name -> completed Future; call .result() to get the
+        value or re-raise the stage's exception
+    """
+    def timed(name, fn):
+        start = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            elapsed[name] = (time.perf_counter() - start) * 1000
+            timings.record(name, elapsed[name])
+
+    elapsed = {}
+    started = time.perf_counter()
+    *pooled, (inline_name, inline_fn) = stages.items()
+    executor = stage_executor()
+    futures = {name: executor.submit(timed, name, fn) for name, fn in pooled}
+
+    inline = futures[inline_name] = Future()
     try:
-        log("=== Care Symbols Inference Function Started ===")
+        inline.set_result(timed(inline_name, inline_fn))
+    except Exception as e:
+        inline.set_exception(e)
+    wait(futures.values())
+    wall_ms = (time.perf_counter() - started) * 1000
+
+    timings.record("parallel_wall", wall_ms)
+    timings.record("overlap_saved", max(0.0, sum(elapsed.values()) - wall_ms))
+    return futures
+
+
+def prefetch_metadata(database_id, collection_id, timings):
+    """Warm the symbol metadata cache; failures are left for enrichment to handle"""
+    try:
+        get_metadata_catalog(database_id, collection_id, timings)
+    except Exception as e:
+        log(f"Metadata prefetch failed: {str(e)}", "WARN")
+
+
+# What the user is told for each failed quality check
+RETAKE_HINTS = {
+    "too_dark": "the photo is too dark, retake it in better light",
+    "overexposed": "the photo is overexposed, avoid glare on the label",
+    "low_contrast": "the label is hard to make out, fill the frame with it",
+    "blurry": "the photo is blurry, hold the camera steady and let it focus",
+}
+
+QUALITY_GATE_MODES = ("off", "report", "enforce")
+
 
-        # Parse request payload
+def quality_gate_mode(payload):
+    """
+    How the quality gate treats this request: "off" skips it, "report"
+    scores images and returns the scores, "enforce" also refuses images
+    that fail. Payload qualityGate overrides QUALITY_GATE (default "off").
+
+    Returns:
+        The mode, or None if the parameter is invalid
+    """
+    mode = payload.get("qualityGate", get_env_var("QUALITY_GATE", required=False) or "off")
+    if mode is True:
+        return "enforce"
+    if mode is False or mode is None:
+        return "off"
+    mode = str(mode).lower()
+    return mode if mode in QUALITY_GATE_MODES else None
+
+
+def check_quality(image_bytes, timings):
+    """
+    Score one image against the quality thresholds.
+
+    Returns:
+        Dict with 'passed', 'reasons', 'scores' and 'thresholds', or None
+        if the image could not be scored (inference then reports why)
+    """
+    thresholds = quality_thresholds()
+    try:
+        with timings.span("quality"):
+            scores = assess_quality(image_bytes)
+    except Exception as e:
+        log(f"Quality check skipped: {str(e)}", "WARN")
+        return None
+
+    reasons = quality_issues(scores, thresholds)
+    increment("quality.checked")
+    for reason in reasons:
+        increment(f"quality.{reason}")
+    return {"passed": not reasons, "reasons": reasons, "scores": scores, "thresholds": thresholds}
+
+
+def retake_response(file_id, quality):
+    """Early answer for a photo the quality gate refused; no inference ran"""
+    increment("quality.rejected")
+    return {
+        "success": False,
+        "fileId": file_id,
+        "retake": True,
+        "error": f"Retake photo: {RETAKE_HINTS[quality['reasons'][0]]}",
+        "quality": quality
+    }
+
+
+def run_batch(file_ids, downloads, top_k, threshold, database_id, collection_id, predictor,
+              timings=None, compact=False, quality_gate="off", download=None):
+    """
+    Run batch inference over several downloaded files.
+
+    Successfully downloaded images go through CareSymbolPredictor.predict_batch,
+    and every file gets its own result entry so one bad file never fails the
+    whole batch.
+
+    Files are classified in chunks of MAX_BATCH_SIZE and their bodies dropped
+    afterwards, so memory is bounded by two chunks (the one being classified
+    and the next one downloading), not by the number of fileIds.
+
+    Args:
+        downloads: Output of download_images for the first chunk of file_ids
+            (or for all of them)
+        download: Callable taking a list of file IDs and returning their
+            download_images output; fetches the chunks downloads doesn't cover
+        compact: Return compact_predictions instead of enriched results
+        quality_gate: Quality gate mode (see quality_gate_mode)
+    """
+    max_batch_size = int(get_env_var("MAX_BATCH_SIZE", required=False) or 16)
+    timings = timings or Timings()
+    cache = get_result_cache()
+
+    def fetch(ids):
+        with timings.span("download"):
+            return download(ids)
+
+    items = [None] * len(file_ids)
+    predictions_by_position = {}
+    stages_by_position = {}
+    cache_keys = {}
+    qualities = {}
+    offset = 0
+    while downloads is not None:
+        end = offset + len(downloads)
+        prefetch = None
+        if end < len(file_ids) and download is not None:
+            prefetch = stage_executor().submit(fetch, file_ids[end:end + max_batch_size])
+
+        images = []
+        image_positions = []
+        for i, outcome in enumerate(downloads, start=offset):
+            file_id = file_ids[i]
+            if isinstance(outcome, Exception):
+                items[i] = {
+                    "fileId": file_id,
+                    "success": False,
+                    "error": f"Failed to download image: {str(outcome)}"
+                }
+                continue
+
+            image_bytes, content_hash = outcome
+            if quality_gate != "off":
+                qualities[i] = check_quality(image_bytes, timings)
+                if quality_gate == "enforce" and qualities[i] and not qualities[i]["passed"]:
+                    items[i] = retake_response(file_id, qualities[i])
+                    continue
+
+            if cache is not None:
+                cache_keys[i] = ResultCache.make_key(content_hash, predictor.model_id, top_k, threshold)
+                cached = cache.get(cache_keys[i])
+                if cached is not None:
+                    predictions_by_position[i] = (cached, True)
+                    continue
+
+            images.append(image_bytes)
+            image_positions.append(i)
+
+        log(f"Running batched inference on {len(images)} of files {offset + 1}-{end}/{len(file_ids)}")
+        outcomes = predictor.predict_batch(
+            images, top_k=top_k, threshold=threshold, max_batch_size=max_batch_size,
+            timings=timings
+        ) if images else []
+        # Release this chunk's image bodies before the next one arrives
+        downloads = images = None
+
+        for i, outcome in zip(image_positions, outcomes):
+            if "error" in outcome:
+                items[i] = {"fileId": file_ids[i], "success": False, "error": outcome["error"]}
+                continue
+            if i in cache_keys:
+                cache.put(cache_keys[i], outcome["predictions"])
+            predictions_by_position[i] = (outcome["predictions"], False)
+            stages_by_position[i] = outcome.get("stage")
+
+        offset = end
+        if prefetch is not None:
+            downloads = prefetch.result()
+
+    for i, (predictions, cached) in predictions_by_position.items():
+        file_id = file_ids[i]
         try:
-            if context.req.body:
-                payload = json.loads(context.req.body)
+            if compact:
+                enriched_results = compact_predictions(predictions)
             else:
-                payload = {}
-        except json.JSONDecodeError as e:
-            return context.res.json({
-                "success": False,
-                "error": f"Invalid JSON payload: {str(e)}"
-            })
-
-        # Validate fileId
-        file_id = payload.get("fileId")
-        if not file_id:
-            return context.res.json({
-                "success": False,
-                "error": "Missing required parameter: fileId"
-            })
-
-        # Optional parameters
-        top_k = payload.get("topK", 5)
-        threshold = payload.get("threshold", 0.5)  # Match local testing threshold
+                with timings.span("enrich"):
+                    enriched_results = enrich_predictions(database_id, collection_id, predictions, timings)
+            items[i] = {
+                "fileId": file_id,
+                "success": True,
+                "cached": cached,
+                "results": enriched_results
+            }
+            if stages_by_position.get(i):
+                items[i]["cascadeStage"] = stages_by_position[i]
+            if qualities.get(i):
+                items[i]["quality"] = qualities[i]
+        except Exception as e:
+            log(f"Failed to enrich results for {file_id}: {str(e)}", "WARN")
+            items[i] = {"fileId": file_id, "success": False, "error": str(e)}
+
+    return items
+
+
+def model_versions():
+    """
+    Named model versions from MODEL_VERSIONS, a JSON object such as
+    {"v2": {"bucketId": "models", "fileId": "abc123"}, "eu": {"path": "/models/eu.tflite"}}.
+    The MODEL_PATH / MODEL_BUCKET_ID / MODEL_FILE_ID model is version "default".
+    """
+    raw = get_env_var("MODEL_VERSIONS", required=False)
+    if not raw:
+        return {}
+    try:
+        versions = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"MODEL_VERSIONS is not valid JSON: {str(e)}")
+    if not isinstance(versions, dict):
+        raise ValueError("MODEL_VERSIONS must be a JSON object of version name -> model source")
+    return versions
+
+
+# (stage model IDs + margin, ModelCascade) of the configured cascade
+_cascade = None
+_cascade_lock = threading.Lock()
+
+
+def load_predictor(use_cascade=True, version=None, evict=True):
+    """
+    Get the predictor for the configured model, loading it if needed.
+
+    version picks a named model from MODEL_VERSIONS instead of the default
+    one. With evict=False, loading it never evicts another model; it raises
+    ModelBudgetExceeded instead when the model does not fit the budget.
+
+    When a fast first-stage model is configured (CASCADE_MODEL_PATH or
+    CASCADE_MODEL_BUCKET_ID + CASCADE_MODEL_FILE_ID), the default model is
+    wrapped in a ModelCascade that only escalates to it on low-confidence
+    images, unless use_cascade is False.
+    """
+    if version and version != "default":
+        spec = model_versions().get(version)
+        if spec is None:
+            raise ValueError(f"Unknown model version: {version}")
+        return CareSymbolPredictor(
+            model_path=spec.get("path"),
+            model_bucket_id=spec.get("bucketId"),
+            model_file_id=spec.get("fileId"),
+            evict=evict
+        )
 
+    # Model configuration - supports local path OR Appwrite Storage
+    predictor = CareSymbolPredictor(
+        model_path=get_env_var("MODEL_PATH", required=False),
+        model_bucket_id=get_env_var("MODEL_BUCKET_ID", required=False),
+        model_file_id=get_env_var("MODEL_FILE_ID", required=False)
+    )
+
+    fast_path = get_env_var("CASCADE_MODEL_PATH", required=False)
+    fast_bucket_id = get_env_var("CASCADE_MODEL_BUCKET_ID", required=False)
+    fast_file_id = get_env_var("CASCADE_MODEL_FILE_ID", required=False)
+    if not use_cascade or not (fast_path or (fast_bucket_id and fast_file_id)):
+        return predictor
+
+    fast = CareSymbolPredictor(
+        model_path=fast_path,
+        model_bucket_id=fast_bucket_id,
+        model_file_id=fast_file_id
+    )
+    margin = float(get_env_var("CASCADE_MARGIN", required=False) or 0.15)
+
+    # Reuse the cascade while it wraps the registry's current instances of
+    # both stages, their model versions and the margin are unchanged, so
+    # callers that group requests by predictor see one object per model.
+    # An evicted and reloaded stage is a new instance, so the cascade must
+    # not keep the old one alive
+    global _cascade
+    key = (fast.model_id, predictor.model_id, margin)
+    with _cascade_lock:
+        current = _cascade is not None and _cascade[0] == key and all(
+            stage is instance for (_, stage), instance in zip(_cascade[1].stages, (fast, predictor))
+        )
+        if not current:
+            _cascade = (key, ModelCascade([("fast", fast), ("full", predictor)], margin=margin))
+        return _cascade[1]
+
+
+# Shadow runs happen off the request path, one at a time; when they fall
+# behind, new ones are skipped rather than queued
+_shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+_shadow_lock = threading.Lock()
+_shadow_pending = 0
+SHADOW_MAX_PENDING = 8
+# A candidate that does not fit the model memory budget is not loaded again
+# for this many seconds
+SHADOW_RETRY_SECONDS = 300
+_shadow_unfit_until = {}    # version -> time.monotonic() to retry at
+
+
+def submit_shadow(image_bytes, predictions, top_k, threshold, tiles=0, served_version=None):
+    """
+    Run the SHADOW_MODEL_VERSION candidate on the same image in the
+    background and record how its labels compare with the served ones.
+    A sampled SHADOW_SAMPLE_RATE fraction (default 1.0) of requests is
+    shadowed, except those already served by the candidate
+    (served_version, None for the default model). Never adds latency to
+    the response: the candidate is loaded without evicting the serving
+    models, and shadowing pauses while it does not fit the memory budget.
+
+    Returns:
+        True if a shadow run was queued
+    """
+    global _shadow_pending
+    version = get_env_var("SHADOW_MODEL_VERSION", required=False)
+    if not version or version == (served_version or "default"):
+        return False
+    if random.random() >= float(get_env_var("SHADOW_SAMPLE_RATE", required=False) or 1.0):
+        return False
+
+    with _shadow_lock:
+        if time.monotonic() < _shadow_unfit_until.get(version, 0.0):
+            increment("shadow.skipped")
+            return False
+        if _shadow_pending >= SHADOW_MAX_PENDING:
+            increment("shadow.skipped")
+            return False
+        _shadow_pending += 1
+    _shadow_executor.submit(_run_shadow, version, image_bytes, predictions, top_k, threshold, tiles)
+    return True
+
+
+def _run_shadow(version, image_bytes, predictions, top_k, threshold, tiles=0):
+    global _shadow_pending
+    try:
+        try:
+            # Evicting a serving model would put its reload on a user request
+            candidate = load_predictor(use_cascade=False, version=version, evict=False)
+        except ModelBudgetExceeded as e:
+            log(f"Skipping shadow runs for {SHADOW_RETRY_SECONDS}s: {str(e)}", "WARN")
+            increment("shadow.skipped")
+            with _shadow_lock:
+                _shadow_unfit_until[version] = time.monotonic() + SHADOW_RETRY_SECONDS
+            return
+        # Spans go to shadow.* histograms, not the served request's
+        shadow_predictions = candidate.predict(
+            image_bytes, top_k=top_k, threshold=threshold, timings=Timings(prefix="shadow."), tiles=tiles
+        )
+
+        served = [p["label"] for p in predictions]
+        shadowed = [p["label"] for p in shadow_predictions]
+        increment("shadow.runs")
+        if served[:1] == shadowed[:1]:
+            increment("shadow.top1_agree")
+        union = set(served) | set(shadowed)
+        increment("shadow.label_overlap", len(set(served) & set(shadowed)) / len(union) if union else 1.0)
+    except Exception as e:
+        log(f"Shadow run on model version {version} failed: {str(e)}", "WARN")
+        increment("shadow.failed")
+    finally:
+        with _shadow_lock:
+            _shadow_pending -= 1
+
+
+def shadow_stats(counters):
+    """Agreement between served and shadow labels, from the telemetry counters"""
+    runs = counters.get("shadow.runs", 0)
+    return {
+        "version": get_env_var("SHADOW_MODEL_VERSION", required=False),
+        "runs": runs,
+        "failed": counters.get("shadow.failed", 0),
+        "skipped": counters.get("shadow.skipped", 0),
+        "top1AgreementRate": round(counters.get("shadow.top1_agree", 0) / runs, 4) if runs else None,
+        "meanLabelOverlap": round(counters.get("shadow.label_overlap", 0) / runs, 4) if runs else None,
+    }
+
+
+def requested_tiles(payload):
+    """
+    Tile budget for a request: "tiles": true (or TILE_IMAGES) uses MAX_TILES,
+    a number asks for at most that many, capped by MAX_TILES. 0 means the
+    image is scored whole; None means the parameter is invalid.
+    """
+    tiles = payload.get(
+        "tiles",
+        (get_env_var("TILE_IMAGES", required=False) or "").lower() in ("1", "true", "yes")
+    )
+    max_tiles = tile_settings()[0]
+    if tiles is True:
+        return max_tiles
+    if not tiles:
+        return 0
+    if isinstance(tiles, (int, float)):
+        return max(0, min(int(tiles), max_tiles))
+    return None
+
+
+def handle_warmup(timings):
+    """
+    Pay every cold-start cost up front: runtime imports, model download and
+    load, a synthetic inference on each pooled interpreter, and the symbol
+    metadata catalog. Meant to be called by a scheduler after a deploy or
+    scale-out so user requests only see the warm path.
+    """
+    database_id = get_env_var("DATABASE_ID")
+    collection_id = get_env_var("COLLECTION_ID")
+
+    with timings.span("import"):
+        import_runtime()
+
+    def fetch_catalog():
+        return get_metadata_catalog(database_id, collection_id, timings)
+
+    stages = run_stages_concurrently({
+        "model_load": load_predictor,
+        "metadata_prefetch": fetch_catalog,
+    }, timings)
+    predictor = stages["model_load"].result()
+
+    with timings.span("warmup_invoke"):
+        interpreters = predictor.warmup()
+
+    try:
+        symbols = len(stages["metadata_prefetch"].result())
+        metadata_error = None
+    except Exception as e:
+        # Enrichment falls back to basic info, so the container is still usable
+        log(f"Metadata prefetch failed: {str(e)}", "WARN")
+        symbols = 0
+        metadata_error = str(e)
+
+    log(f"Warm-up complete: model {predictor.model_id}, {interpreters} interpreter(s), {symbols} symbols")
+    increment("warmups")
+    return {
+        "success": True,
+        "modelId": predictor.model_id,
+        "interpreters": interpreters,
+        "symbols": symbols,
+        "metadataError": metadata_error,
+    }
+
+
+def handle_request(payload, timings, inline_image=None, infer=None):
+    """
+    Validate the payload, run single-file or batch inference and build the
+    response body. inline_image holds image bytes sent in the request itself,
+    which replace the Storage download. infer, if given, replaces
+    predictor.predict for single images and is called as
+    infer(predictor, image_bytes, top_k, threshold, timings, report).
+    Raises ValueError for configuration errors.
+    """
+    # Explicit cache invalidation, e.g. after editing the care_symbols collection
+    if payload.get("action") == "invalidateMetadata":
+        invalidate_metadata_cache()
+        return {"success": True}
+
+    # Validate fileId / fileIds
+    file_id = payload.get("fileId")
+    file_ids = payload.get("fileIds")
+    if file_ids is not None and (
+        not isinstance(file_ids, list)
+        or not file_ids
+        or not all(isinstance(f, str) and f for f in file_ids)
+    ):
+        return {
+            "success": False,
+            "error": "Parameter fileIds must be a non-empty list of file IDs"
+        }
+    max_file_ids = int(get_env_var("MAX_FILE_IDS", required=False) or 64)
+    if file_ids is not None and len(file_ids) > max_file_ids:
+        return {
+            "success": False,
+            "error": f"Parameter fileIds must list at most {max_file_ids} file IDs"
+        }
+    if inline_image is not None and (file_id or file_ids):
+        return {
+            "success": False,
+            "error": "Send either an inline image or fileId/fileIds, not both"
+        }
+    if not file_id and not file_ids and inline_image is None:
+        return {
+            "success": False,
+            "error": "Missing required parameter: fileId"
+        }
+
+    # Optional parameters
+    top_k = payload.get("topK", 5)
+    threshold = payload.get("threshold", 0.5)  # Match local testing threshold
+    use_cascade = payload.get("cascade", True)
+    compact = bool(payload.get("compact", False))
+    tiles = requested_tiles(payload) if not file_ids else 0
+    if tiles is None:
+        return {
+            "success": False,
+            "error": "Parameter tiles must be true, false or a number"
+        }
+    if file_ids and payload.get("tiles"):
+        # TILE_IMAGES still applies to single images only, but an explicit
+        # request must not silently go untiled
+        return {
+            "success": False,
+            "error": "Parameter tiles is not supported with fileIds"
+        }
+    quality_gate = quality_gate_mode(payload)
+    if quality_gate is None:
+        return {
+            "success": False,
+            "error": f"Parameter qualityGate must be one of: {', '.join(QUALITY_GATE_MODES)}"
+        }
+    model_version = payload.get("modelVersion")
+    if model_version is not None and model_version != "default" and model_version not in model_versions():
+        return {
+            "success": False,
+            "error": f"Unknown modelVersion: {model_version}"
+        }
+    preview = payload.get(
+        "preview",
+        (get_env_var("USE_IMAGE_PREVIEW", required=False) or "").lower() in ("1", "true", "yes")
+    )
+
+    if file_ids:
+        log(f"Processing {len(file_ids)} fileIds, topK={top_k}, threshold={threshold}")
+    elif inline_image is not None:
+        log(f"Processing inline image ({len(inline_image)} bytes), topK={top_k}, threshold={threshold}")
+    else:
         log(f"Processing fileId={file_id}, topK={top_k}, threshold={threshold}")
 
-        # Get environment configuration
-        bucket_id = get_env_var("BUCKET_ID")
-        database_id = get_env_var("DATABASE_ID")
-        collection_id = get_env_var("COLLECTION_ID")
+    # Get environment configuration
+    bucket_id = get_env_var("BUCKET_ID")
+    database_id = get_env_var("DATABASE_ID")
+    collection_id = get_env_var("COLLECTION_ID")
 
-        # Model configuration - supports local path OR Appwrite Storage
-        model_path = get_env_var("MODEL_PATH", required=False)
-        model_bucket_id = get_env_var("MODEL_BUCKET_ID", required=False)
-        model_file_id = get_env_var("MODEL_FILE_ID", required=False)
+    check_appwrite_config()
 
-        # Initialize Appwrite client
-        client = init_appwrite_client()
+    # Image download, model fetch/load and metadata prefetch are independent,
+    # so on a cold start they overlap instead of adding up
+    stages = {
+        "model_load": lambda: load_predictor(use_cascade, model_version),
+        "metadata_prefetch": lambda: prefetch_metadata(database_id, collection_id, timings),
+    }
+    if inline_image is not None:
+        # Already in hand; only the header check and hash are left to do
+        with timings.span("inline_check"):
+            image_format, _ = check_image_header(inline_image, image_limits()[1], complete=True)
+            content_hash = hashlib.sha256(inline_image).hexdigest()
+        image_bytes = inline_image
 
+        persist = payload.get(
+            "persist",
+            (get_env_var("PERSIST_INLINE_IMAGES", required=False) or "").lower() in ("1", "true", "yes")
+        )
+        if persist:
+            file_id = new_file_id()
+            persist_image_async(bucket_id, file_id, inline_image, image_format)
+    elif file_ids:
+        max_workers = int(get_env_var("DOWNLOAD_CONCURRENCY", required=False) or 8)
+        download_chunk = lambda ids: download_images(
+            bucket_id, ids, max_workers=max_workers, preview=preview
+        )
+        # Only the first chunk overlaps model load; run_batch fetches the rest
+        first_chunk = file_ids[:int(get_env_var("MAX_BATCH_SIZE", required=False) or 16)]
+        download = lambda: download_chunk(first_chunk)
+    else:
         # Download image (using direct HTTP to avoid SDK bug)
-        image_bytes = download_image(client, bucket_id, file_id)
+        download = lambda: download_image(bucket_id, file_id, preview=preview)
+
+    if inline_image is None:
+        stages["download"] = download
+    stages = run_stages_concurrently(stages, timings)
+    predictor = stages["model_load"].result()
+
+    if file_ids:
+        # Popped so the first chunk's bodies can be freed once classified
+        items = run_batch(
+            file_ids, stages.pop("download").result(), top_k, threshold,
+            database_id, collection_id, predictor, timings, compact=compact,
+            quality_gate=quality_gate, download=download_chunk
+        )
+        succeeded = sum(1 for item in items if item["success"])
+        log(f"=== Batch completed: {succeeded}/{len(items)} files succeeded ===")
+
+        result = {
+            "success": True,
+            "results": items
+        }
+        if compact:
+            result["metadataVersion"] = metadata_version(database_id, collection_id, timings)
+        if model_version is not None:
+            result["modelVersion"] = model_version
+        return result
+
+    if inline_image is None:
+        image_bytes, content_hash = stages["download"].result()
         log(f"Downloaded {len(image_bytes)} bytes")
 
-        # Load model and run inference
+    # Unusable photos are turned back before any inference is spent on them
+    quality = check_quality(image_bytes, timings) if quality_gate != "off" else None
+    if quality_gate == "enforce" and quality and not quality["passed"]:
+        log(f"Quality gate refused {file_id or 'inline image'}: {', '.join(quality['reasons'])}")
+        return retake_response(file_id, quality)
+
+    # Serve repeat submissions of the same image from the result cache
+    cache = get_result_cache()
+    model_key = f"{predictor.model_id}:tiles={tiles}" if tiles > 1 else predictor.model_id
+    cache_key = ResultCache.make_key(content_hash, model_key, top_k, threshold)
+    predictions = cache.get(cache_key) if cache is not None else None
+    cached = predictions is not None
+    report = {}
+
+    if cached:
+        log(f"Result cache hit for {content_hash[:8]} ({cache.stats()['hits']} hits so far)")
+    else:
         log("Running inference...")
-        predictor = CareSymbolPredictor(
-            model_path=model_path,
-            model_bucket_id=model_bucket_id,
-            model_file_id=model_file_id
-        )
-        predictions = predictor.predict(image_bytes, top_k=top_k, threshold=threshold)
-        log(f"Got {len(predictions)} predictions")
+        # A tiled image is already a batch of its own
+        if infer is None or tiles > 1:
+            predictions = predictor.predict(
+                image_bytes, top_k=top_k, threshold=threshold, timings=timings, report=report,
+                tiles=tiles
+            )
+        else:
+            predictions = infer(predictor, image_bytes, top_k, threshold, timings, report)
+        if payload.get("shadow", True):
+            submit_shadow(image_bytes, predictions, top_k, threshold, tiles, model_version)
+        if cache is not None:
+            cache.put(cache_key, predictions)
+    log(f"Got {len(predictions)} predictions")
 
+    if compact:
+        # Clients resolve indices against the bundle from GET /metadata
+        enriched_results = compact_predictions(predictions)
+    else:
         # Enrich with database metadata (using direct HTTP to avoid SDK bug)
-        enriched_results = enrich_predictions(
-            database_id, collection_id, predictions
-        )
+        with timings.span("enrich"):
+            enriched_results = enrich_predictions(
+                database_id, collection_id, predictions, timings
+            )
 
-        log(f"=== Function completed successfully with {len(enriched_results)} results ===")
+    log(f"=== Function completed successfully with {len(enriched_results)} results ===")
 
-        return context.res.json({
-            "success": True,
-            "fileId": file_id,
-            "results": enriched_results
-        })
+    result = {
+        "success": True,
+        "fileId": file_id,
+        "cached": cached,
+        "results": enriched_results
+    }
+    if compact:
+        result["metadataVersion"] = metadata_version(database_id, collection_id, timings)
+    if quality:
+        result["quality"] = quality
+    if "tiles" in report:
+        # Model inputs the image was split into
+        result["tiles"] = report.pop("tiles")
+    if report:
+        # Which cascade stage answered
+        result["cascade"] = report
+    if model_version is not None:
+        result["modelVersion"] = model_version
+    return result
+
+
+def collect_stats():
+    """Snapshot of latency histograms, counters and cache/pool state for this process"""
+    stats = snapshot()
+    cache = get_result_cache()
+    stats["resultCache"] = cache.stats() if cache is not None else None
+    stats["connections"] = connection_stats()
+    stats["models"] = CareSymbolPredictor.registry_stats()
+    stats["cascade"] = cascade_stats()
+    stats["shadow"] = shadow_stats(stats["counters"])
+    stats["startup"] = {
+        "moduleImportMs": round(_module_import_ms, 2),
+        "imports": import_profile.report(),
+    }
+    return stats
+
+
+# Flipped by the first invocation, so cold and warm latencies are tracked apart
+_warm = False
+
+
+def process(req, infer=None):
+    """
+    Handle one request and return the response body as a dict.
+
+    req needs the attributes of an Appwrite request that read_request uses
+    (body, headers, optionally body_binary). infer is passed through to
+    handle_request; the standalone server uses it to micro-batch inference.
+    """
+    global _warm
+    cold_start = not _warm
+    _warm = True
+
+    timings = Timings()
+    started = time.perf_counter()
+    include_timings = os.environ.get("INCLUDE_TIMINGS", "").lower() in ("1", "true", "yes")
+
+    try:
+        log("=== Care Symbols Inference Function Started ===")
+
+        # Parse request payload, plus any image sent inline
+        with timings.span("parse"):
+            try:
+                payload, inline_image = read_request(req)
+            except json.JSONDecodeError as e:
+                return {
+                    "success": False,
+                    "error": f"Invalid JSON payload: {str(e)}"
+                }
+
+        # Metrics snapshot; not counted as a request itself
+        if payload.get("action") == "stats":
+            return {"success": True, "stats": collect_stats()}
+
+        # Pre-warm the container; always reports its step timings and is
+        # kept out of the request latency histograms
+        if payload.get("action") == "warmup":
+            result = handle_warmup(timings)
+            total_ms = (time.perf_counter() - started) * 1000
+            observe("warmup", total_ms)
+            result["timings"] = dict(
+                timings.as_dict(), total=round(total_ms, 2), coldStart=cold_start
+            )
+            return result
+
+        include_timings = include_timings or bool(payload.get("timings"))
+        result = handle_request(payload, timings, inline_image, infer=infer)
+
+    except ImageRejected as e:
+        # Refused upload (too large, unsupported format, too many pixels)
+        log(f"Image rejected: {str(e)}", "WARN")
+        result = {
+            "success": False,
+            "error": f"Image rejected: {str(e)}"
+        }
 
     except ValueError as e:
         # Configuration errors
         log(f"Configuration error: {str(e)}", "ERROR")
-        return context.res.json({
+        result = {
             "success": False,
             "error": f"Configuration error: {str(e)}"
-        })
+        }
 
     except Exception as e:
         # Unexpected errors
@@ -260,7 +1233,53 @@ def main(context):
         import traceback
         traceback.print_exc()
 
-        return context.res.json({
+        result = {
             "success": False,
             "error": str(e)
-        })
+        }
+
+    total_ms = (time.perf_counter() - started) * 1000
+    observe("request.cold" if cold_start else "request.warm", total_ms)
+    increment("requests.cold" if cold_start else "requests.warm")
+    if not result.get("success"):
+        increment("requests.failed")
+
+    if include_timings:
+        result["timings"] = dict(
+            timings.as_dict(), total=round(total_ms, 2), coldStart=cold_start
+        )
+
+    return result
+
+
+def main(context):
+    """
+    Appwrite Function entrypoint
+
+    Expected payload: { "fileId": "..." }
+    Optional: { "fileId": "...", "topK": 5, "threshold": 0.1, "modelVersion": "v2",
+                "preview": true, "cascade": false, "timings": true }
+    Batch: { "fileIds": ["...", "..."], "topK": 5, "threshold": 0.1 }
+    Metrics: { "action": "stats" }
+    Inline: { "image": "<base64>", "persist": true } or multipart/form-data with an "image" part
+    Warm-up: { "action": "warmup" }
+    Compact: { "fileId": "...", "compact": true }
+    Tiled: { "fileId": "...", "tiles": true }
+    Quality gate: { "fileId": "...", "qualityGate": "enforce" }
+    Metadata bundle: GET /metadata (ETag / If-None-Match)
+
+    Returns: { "success": true, "results": [...] }
+    Batch returns: { "success": true, "results": [{ "fileId": "...", "success": true, "results": [...] }, ...] }
+    """
+    req = context.req
+    if getattr(req, "method", "POST") == "GET" and (getattr(req, "path", "") or "").rstrip("/").endswith("/metadata"):
+        status, body, headers = metadata_response(getattr(req, "headers", None))
+        if body is None:
+            return context.res.send("", status, headers)
+        return context.res.json(body, status, headers)
+    return context.res.json(process(context.req))
+
+
+# Everything above ran at import time; a cold start pays for it once
+_module_import_ms = (time.perf_counter() - _import_started) * 1000
+observe("startup.import", _module_import_ms)
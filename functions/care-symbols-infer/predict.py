@@ -5,30 +5,53 @@ Loads model once and provides prediction interface.
 Supports loading model from local path or Appwrite Storage.
 """
 
+import math
 import os
-import sys
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from io import BytesIO
 
+try:
+    from .appwrite_http import appwrite_get  # when loaded as package "function"
+    from .telemetry import Timings, increment, log, log_enabled
+except ImportError:
+    from appwrite_http import appwrite_get   # fallback for local runs
+    from telemetry import Timings, increment, log, log_enabled
+
 # Lazy imports to speed up cold start
 # TensorFlow Lite is only imported when actually needed
 numpy = None
 Image = None
 tflite = None
 
+# The download and model-load stages run on separate threads during a cold
+# start; numpy's package init is not safe to run from two threads at once.
+# One lock per module, so PIL (download) and TFLite (model load) still
+# import side by side; both import numpy, so both take the numpy lock first
+_numpy_lock = threading.Lock()
+_pil_lock = threading.Lock()
+_tflite_lock = threading.Lock()
+
 
 def _lazy_import_tflite():
     """Lazy import TensorFlow Lite runtime to reduce cold start time"""
     global tflite
     if tflite is None:
-        print("[INFO] Importing TFLite runtime...", file=sys.stderr, flush=True)
-        try:
-            # Try ai-edge-litert first (newer Google package)
-            from ai_edge_litert import interpreter as _tflite
-        except ImportError:
-            # Fallback to tflite_runtime (older package)
-            from tflite_runtime import interpreter as _tflite
-        tflite = _tflite
-        print("[INFO] TFLite runtime imported successfully", file=sys.stderr, flush=True)
+        with _tflite_lock:
+            if tflite is None:
+                log("Importing TFLite runtime...")
+                _lazy_import_numpy()
+                try:
+                    # Try ai-edge-litert first (newer Google package)
+                    from ai_edge_litert import interpreter as _tflite
+                except ImportError:
+                    # Fallback to tflite_runtime (older package)
+                    from tflite_runtime import interpreter as _tflite
+                tflite = _tflite
+                log("TFLite runtime imported successfully")
     return tflite
 
 
@@ -36,8 +59,10 @@ def _lazy_import_numpy():
     """Lazy import numpy"""
     global numpy
     if numpy is None:
-        import numpy as _numpy
-        numpy = _numpy
+        with _numpy_lock:
+            if numpy is None:
+                import numpy as _numpy
+                numpy = _numpy
     return numpy
 
 
@@ -45,154 +70,969 @@ def _lazy_import_pil():
     """Lazy import PIL"""
     global Image
     if Image is None:
-        from PIL import Image as _Image
-        Image = _Image
+        with _pil_lock:
+            if Image is None:
+                # PIL pulls in numpy.typing when numpy is installed
+                _lazy_import_numpy()
+                from PIL import Image as _Image
+                Image = _Image
     return Image
 
 
-class CareSymbolPredictor:
-    """Singleton-style predictor that loads the model once"""
+def import_runtime():
+    """Import TFLite, numpy and PIL now rather than on first use (warm-up)"""
+    _lazy_import_numpy()
+    _lazy_import_pil()
+    _lazy_import_tflite()
 
-    _instance = None
-    _interpreter = None
-    _input_details = None
-    _output_details = None
-    _model_loaded = False
 
-    def __new__(cls, model_path=None, model_bucket_id=None, model_file_id=None):
-        if cls._instance is None:
-            cls._instance = super(CareSymbolPredictor, cls).__new__(cls)
+class ImageRejected(Exception):
+    """Raised when an image is refused before it is decoded (size, format or dimensions)"""
 
-        # Only load model once, but allow reinitialization if parameters change
-        if not cls._model_loaded:
-            cls._instance._load_model(model_path, model_bucket_id, model_file_id)
-            cls._model_loaded = True
 
-        return cls._instance
+class ModelBudgetExceeded(Exception):
+    """Raised when a model loaded without eviction does not fit the memory budget"""
 
-    def _load_model(self, model_path=None, model_bucket_id=None, model_file_id=None):
-        """
-        Load the TensorFlow Lite model from local path or Appwrite Storage.
 
-        Priority:
-        1. If model_path exists locally, use it
-        2. Check /tmp cache for previously downloaded model
-        3. If model credentials provided, download from Appwrite Storage to /tmp
-        4. Raise error if neither available
+# Formats users upload that PIL can decode here
+ALLOWED_IMAGE_FORMATS = {"JPEG", "MPO", "PNG", "WEBP", "GIF", "BMP", "TIFF"}
 
-        The model download is separate from loading to allow caching.
-        """
-        # Lazy import TensorFlow Lite only when actually loading the model
-        _tflite = _lazy_import_tflite()
+# Give up identifying a file whose header is not parseable within this many bytes
+HEADER_PROBE_LIMIT = 2 * 1024 * 1024
 
-        # Determine the model path to load from
-        final_model_path = None
 
-        # Option 1: Load from local bundled path
-        if model_path and os.path.exists(model_path):
-            print(f"[INFO] Using bundled model at: {model_path}", file=sys.stderr, flush=True)
-            final_model_path = model_path
+def image_limits():
+    """
+    Upload limits from the environment.
 
-        # Option 2: Check /tmp cache or download from Appwrite Storage
-        elif model_bucket_id and model_file_id:
-            temp_model_path = "/tmp/care_symbols_model.tflite"
+    MAX_IMAGE_BYTES: largest accepted file (default 15 MB)
+    MAX_IMAGE_PIXELS: largest accepted width x height (default 50 megapixels)
+    """
+    max_bytes = int(os.environ.get("MAX_IMAGE_BYTES") or 15 * 1024 * 1024)
+    max_pixels = int(os.environ.get("MAX_IMAGE_PIXELS") or 50_000_000)
+    return max_bytes, max_pixels
 
-            # Check if model is already cached in /tmp (from previous execution)
-            if os.path.exists(temp_model_path):
-                print(f"[INFO] Using cached model from {temp_model_path}", file=sys.stderr, flush=True)
-                final_model_path = temp_model_path
-            else:
-                # Download model from Storage using direct HTTP
-                print(f"[INFO] Model not cached. Downloading from Appwrite Storage (bucket={model_bucket_id}, file={model_file_id})", file=sys.stderr, flush=True)
 
-                # Direct HTTP request to avoid SDK bug
-                import requests
-                endpoint = os.environ.get("APPWRITE_ENDPOINT")
-                project_id = os.environ.get("APPWRITE_PROJECT_ID")
-                api_key = os.environ.get("APPWRITE_API_KEY")
+def tile_settings():
+    """
+    Tiling limits from the environment.
 
-                url = f"{endpoint}/storage/buckets/{model_bucket_id}/files/{model_file_id}/download"
-                headers = {
-                    "X-Appwrite-Project": project_id,
-                    "X-Appwrite-Key": api_key
-                }
+    MAX_TILES: most model inputs one tiled image may become, including the
+        whole-image view (default 8)
+    TILE_OVERLAP: least fraction of a tile shared with its neighbour
+        (default 0.25), so a symbol on a tile edge is whole in another tile
+    """
+    max_tiles = int(os.environ.get("MAX_TILES") or 8)
+    overlap = min(0.9, max(0.0, float(os.environ.get("TILE_OVERLAP") or 0.25)))
+    return max_tiles, overlap
 
-                response = requests.get(url, headers=headers)
-                response.raise_for_status()
-                model_bytes = response.content
 
-                # Save to /tmp for caching across warm starts
-                print(f"[INFO] Saving model to {temp_model_path} ({len(model_bytes)} bytes)", file=sys.stderr, flush=True)
-                with open(temp_model_path, "wb") as f:
-                    f.write(model_bytes)
+def check_image_header(data, max_pixels, complete=False):
+    """
+    Identify an image from its first bytes and enforce format/dimension limits.
 
-                print(f"[INFO] Model cached successfully", file=sys.stderr, flush=True)
-                final_model_path = temp_model_path
+    Image.open only parses the header, so this is cheap and works on a
+    partial download.
 
-        else:
-            # No valid source
+    Args:
+        data: Leading bytes of the file (or the whole file)
+        max_pixels: Largest accepted width x height
+        complete: True if data is the whole file
+
+    Returns:
+        Tuple of (format, (width, height)), or None if the header is not
+        complete yet and more data should be read
+
+    Raises:
+        ImageRejected: Unsupported format, corrupt header or too many pixels
+    """
+    _Image = _lazy_import_pil()
+    try:
+        with _Image.open(BytesIO(data)) as img:
+            image_format, size = img.format, img.size
+    except _Image.DecompressionBombError as e:
+        raise ImageRejected(f"Image dimensions too large: {str(e)}")
+    except Exception:
+        if complete or len(data) >= HEADER_PROBE_LIMIT:
+            raise ImageRejected("Unsupported or corrupt image file")
+        return None
+
+    if image_format not in ALLOWED_IMAGE_FORMATS:
+        raise ImageRejected(f"Unsupported image format: {image_format}")
+    if size[0] * size[1] > max_pixels:
+        raise ImageRejected(
+            f"Image dimensions too large: {size[0]}x{size[1]} exceeds {max_pixels} pixels"
+        )
+    return image_format, size
+
+
+def decode_image(image_bytes, target_size):
+    """
+    Decode image bytes to an RGB uint8 array of the model's input size.
+
+    JPEGs are decoded in draft mode, which lets libjpeg scale the image down
+    by 1/2, 1/4 or 1/8 while decoding (never below target_size), so a 12MP
+    phone photo is never fully materialized. Other formats are shrunk with
+    reduce() before the final resample via resize's reducing_gap.
+
+    Args:
+        image_bytes: Raw image file bytes
+        target_size: (width, height) expected by the model
+
+    Returns:
+        numpy array of shape (height, width, 3), dtype uint8
+    """
+    _Image = _lazy_import_pil()
+    _np = _lazy_import_numpy()
+
+    img = _Image.open(BytesIO(image_bytes))
+    if img.format == "JPEG":
+        img.draft("RGB", target_size)
+
+    # Convert to RGB if needed
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    if img.size != target_size:
+        img = img.resize(target_size, reducing_gap=3.0)
+
+    return _np.asarray(img)
+
+
+# Longest side of the grayscale copy the quality gate scores
+QUALITY_SAMPLE_SIZE = 256
+
+
+def quality_thresholds():
+    """
+    Quality gate limits from the environment, on the 0-255 gray scale.
+
+    QUALITY_MIN_SHARPNESS: least variance of the Laplacian (default 20)
+    QUALITY_MIN_CONTRAST: least standard deviation of gray levels (default 15)
+    QUALITY_MIN_BRIGHTNESS / QUALITY_MAX_BRIGHTNESS: bounds on the mean gray
+        level (default 35 / 230)
+    """
+    return {
+        "minSharpness": float(os.environ.get("QUALITY_MIN_SHARPNESS") or 20),
+        "minContrast": float(os.environ.get("QUALITY_MIN_CONTRAST") or 15),
+        "minBrightness": float(os.environ.get("QUALITY_MIN_BRIGHTNESS") or 35),
+        "maxBrightness": float(os.environ.get("QUALITY_MAX_BRIGHTNESS") or 230),
+    }
+
+
+def assess_quality(image_bytes, sample_size=QUALITY_SAMPLE_SIZE):
+    """
+    Score sharpness, contrast and exposure on a small grayscale copy.
+
+    JPEGs are decoded straight to grayscale in draft mode at 1/2-1/8 scale,
+    so even a 12MP photo costs a few milliseconds. Every score is one
+    vectorized NumPy reduction over the copy.
+
+    Returns:
+        Dict with 'sharpness' (variance of the 4-neighbour Laplacian),
+        'contrast' (standard deviation of gray levels) and 'brightness'
+        (mean gray level)
+    """
+    _Image = _lazy_import_pil()
+    _np = _lazy_import_numpy()
+
+    img = _Image.open(BytesIO(image_bytes))
+    if img.format == "JPEG":
+        img.draft("L", (sample_size, sample_size))
+    # Shrink before converting, so other formats convert the small copy only
+    img.thumbnail((sample_size, sample_size), reducing_gap=2.0)
+    img = img.convert("L")
+    gray = _np.asarray(img, dtype=_np.float32)
+
+    if min(gray.shape) >= 3:
+        laplacian = (
+            gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+            - 4.0 * gray[1:-1, 1:-1]
+        )
+        sharpness = float(laplacian.var())
+    else:
+        sharpness = 0.0
+
+    return {
+        "sharpness": round(sharpness, 2),
+        "contrast": round(float(gray.std()), 2),
+        "brightness": round(float(gray.mean()), 2),
+    }
+
+
+def quality_issues(scores, thresholds):
+    """Reasons the scores fail the thresholds, worst first; empty if the photo is usable"""
+    reasons = []
+    if scores["brightness"] < thresholds["minBrightness"]:
+        reasons.append("too_dark")
+    elif scores["brightness"] > thresholds["maxBrightness"]:
+        reasons.append("overexposed")
+    # Blur also flattens contrast, so it is the likelier cause of both
+    if scores["sharpness"] < thresholds["minSharpness"]:
+        reasons.append("blurry")
+    if scores["contrast"] < thresholds["minContrast"]:
+        reasons.append("low_contrast")
+    return reasons
+
+
+def tile_grid(image_size, target_size, max_tiles, overlap):
+    """
+    Plan the tiles for an image of image_size (width, height).
+
+    The image is scaled so its short side spans one tile, then covered with
+    target_size windows overlapping by at least `overlap`. When that takes
+    more than max_tiles - 1 windows (one input is kept for the whole-image
+    view), the image is scaled down until the grid fits.
+
+    Returns:
+        Tuple of (scaled (width, height), x offsets, y offsets); a single
+        offset on both axes means tiling would add nothing
+    """
+    width, height = image_size
+    tile_width, tile_height = target_size
+    stride = 1.0 - overlap
+
+    def axis(length, tile):
+        count = 1 if length <= tile else math.ceil((length - tile) / (tile * stride)) + 1
+        if count == 1:
+            return [0]
+        # Spread evenly: neighbours overlap at least as much as asked
+        return [round(i * (length - tile) / (count - 1)) for i in range(count)]
+
+    # Never upscale: tiles of an image smaller than a tile add nothing
+    scale = min(1.0, max(tile_width / width, tile_height / height))
+    while True:
+        scaled = (max(tile_width, round(width * scale)), max(tile_height, round(height * scale)))
+        xs, ys = axis(scaled[0], tile_width), axis(scaled[1], tile_height)
+        if len(xs) * len(ys) <= max(1, max_tiles - 1):
+            return scaled, xs, ys
+        scale *= 0.9
+
+
+def decode_tiles(image_bytes, target_size, max_tiles=8, overlap=0.25):
+    """
+    Decode image bytes into the whole-image view plus overlapping
+    model-sized tiles (see tile_grid), for long labels where squashing the
+    photo to one input leaves each symbol a few pixels wide.
+
+    Returns:
+        numpy array of shape (tiles, height, width, 3), dtype uint8, with
+        the whole-image view first. Images that fit in one tile come back
+        as the whole-image view alone.
+    """
+    _Image = _lazy_import_pil()
+    _np = _lazy_import_numpy()
+
+    img = _Image.open(BytesIO(image_bytes))
+    scaled, xs, ys = tile_grid(img.size, target_size, max_tiles, overlap)
+    if img.format == "JPEG":
+        img.draft("RGB", scaled)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    whole = _np.asarray(img.resize(target_size, reducing_gap=3.0))
+    if len(xs) * len(ys) == 1:
+        return whole[None]
+
+    tile_width, tile_height = target_size
+    pixels = _np.asarray(img.resize(scaled, reducing_gap=3.0))
+    tiles = [whole] + [pixels[y:y + tile_height, x:x + tile_width] for y in ys for x in xs]
+    return _np.stack(tiles)
+
+
+def fill_input(dest, pixels, quantization=(0.0, 0)):
+    """
+    Write a uint8 RGB image into one slot of the model's input tensor.
+
+    dest is a view of the interpreter's input buffer. FLOAT32 models get
+    pixels scaled to 0.0-1.0. Integer models get the same 0.0-1.0 values
+    quantized with the input tensor's (scale, zero_point); when that is
+    1/255 and 0, or the input is not quantized, pixels are copied as-is.
+    """
+    _np = _lazy_import_numpy()
+    if dest.dtype.kind == "f":
+        # Model expects FLOAT32, normalize to 0.0-1.0
+        _np.multiply(pixels, _np.float32(1.0 / 255.0), out=dest, dtype=dest.dtype)
+        return
+
+    scale, zero_point = quantization or (0.0, 0)
+    if not scale or (abs(scale * 255.0 - 1.0) < 1e-6 and zero_point == 0):
+        # Model expects raw 0-255 pixels, keep as-is
+        _np.copyto(dest, pixels, casting="unsafe")
+        return
+
+    # q = (pixel / 255) / scale + zero_point, rounded and clamped to the dtype
+    limits = _np.iinfo(dest.dtype)
+    values = pixels.astype(_np.float32)
+    values *= _np.float32(1.0 / (255.0 * scale))
+    values += _np.float32(zero_point)
+    _np.rint(values, out=values)
+    _np.clip(values, limits.min, limits.max, out=values)
+    _np.copyto(dest, values, casting="unsafe")
+
+
+# Downloaded models are cached here, one file per bucket/file ID and checksum
+MODEL_CACHE_DIR = "/tmp/care_symbols_models"
+
+
+def fetch_model_metadata(model_bucket_id, model_file_id):
+    """
+    Fetch the Storage metadata of the model file.
+
+    This is a small JSON document, so it is a cheap way to find out whether
+    the model in Storage changed. 'signature' is the MD5 of the file contents.
+    """
+    response = appwrite_get(
+        f"/storage/buckets/{model_bucket_id}/files/{model_file_id}", "model_metadata"
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def _model_cache_path(model_bucket_id, model_file_id, signature):
+    """Path of the cached copy of one version of a model file"""
+    prefix = _model_cache_prefix(model_bucket_id, model_file_id)
+    return os.path.join(MODEL_CACHE_DIR, f"{prefix}{signature or 'unsigned'}.tflite")
+
+
+def _model_cache_prefix(model_bucket_id, model_file_id):
+    # Appwrite IDs are [a-zA-Z0-9._-], but never trust them as path components
+    safe = lambda value: "".join(c if c.isalnum() or c in "-_" else "_" for c in str(value))
+    return f"{safe(model_bucket_id)}__{safe(model_file_id)}__"
+
+
+def _remove_stale_model_versions(model_bucket_id, model_file_id, keep_path):
+    """Delete cached versions of a model other than keep_path"""
+    prefix = _model_cache_prefix(model_bucket_id, model_file_id)
+    try:
+        for name in os.listdir(MODEL_CACHE_DIR):
+            path = os.path.join(MODEL_CACHE_DIR, name)
+            if name.startswith(prefix) and path != keep_path:
+                os.remove(path)
+                log(f"Removed stale cached model {path}")
+    except OSError as e:
+        log(f"Failed to clean model cache: {str(e)}", "WARN")
+
+
+def download_model(model_bucket_id, model_file_id, signature, dest_path):
+    """
+    Stream the model file from Appwrite Storage to dest_path.
+
+    The file is written to a temporary name in the same directory, checked
+    against the expected MD5 signature, and only then renamed into place,
+    so a crashed or truncated download can never be loaded as a model.
+    """
+    import hashlib
+
+    tmp_path = f"{dest_path}.{os.getpid()}.part"
+    md5 = hashlib.md5()
+    size = 0
+
+    try:
+        path = f"/storage/buckets/{model_bucket_id}/files/{model_file_id}/download"
+        with appwrite_get(path, "model", stream=True) as response:
+            response.raise_for_status()
+            with open(tmp_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
+                    md5.update(chunk)
+                    size += len(chunk)
+
+        if signature and md5.hexdigest() != signature:
             raise ValueError(
-                "No valid model source provided. Either provide a local model_path "
-                "or Appwrite Storage credentials (model_bucket_id, model_file_id)"
+                f"Model checksum mismatch: expected {signature}, got {md5.hexdigest()}"
             )
 
-        # Now load the TFLite model
-        print(f"[INFO] Loading TensorFlow Lite model from {final_model_path}...", file=sys.stderr, flush=True)
-        self._interpreter = _tflite.Interpreter(model_path=final_model_path)
-        self._interpreter.allocate_tensors()
+        os.replace(tmp_path, dest_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    log(f"Model cached at {dest_path} ({size} bytes)")
+
+
+def resolve_storage_model(model_bucket_id, model_file_id, metadata=None):
+    """
+    Return (path, signature) of a verified local copy of the model in Storage,
+    downloading it if this version is not cached yet.
+
+    metadata is the file's Storage metadata when the caller already fetched
+    it. If the metadata endpoint cannot be reached, the newest cached version
+    of the same file is used instead so a Storage hiccup does not take the
+    function down.
+    """
+    os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+
+    try:
+        if metadata is None:
+            metadata = fetch_model_metadata(model_bucket_id, model_file_id)
+    except Exception as e:
+        prefix = _model_cache_prefix(model_bucket_id, model_file_id)
+        cached = [
+            os.path.join(MODEL_CACHE_DIR, name) for name in os.listdir(MODEL_CACHE_DIR)
+            if name.startswith(prefix) and name.endswith(".tflite")
+        ]
+        if not cached:
+            raise
+        path = max(cached, key=os.path.getmtime)
+        signature = os.path.basename(path)[len(prefix):-len(".tflite")]
+        log(f"Model metadata unavailable ({str(e)}), using cached {path}", "WARN")
+        return path, signature
+
+    signature = metadata.get("signature")
+    expected_size = metadata.get("sizeOriginal")
+    path = _model_cache_path(model_bucket_id, model_file_id, signature)
+
+    if os.path.exists(path) and (not expected_size or os.path.getsize(path) == expected_size):
+        log(f"Using cached model from {path}")
+    else:
+        log(f"Model not cached. Downloading from Appwrite Storage (bucket={model_bucket_id}, file={model_file_id})")
+        download_model(model_bucket_id, model_file_id, signature, path)
+        _remove_stale_model_versions(model_bucket_id, model_file_id, path)
+
+    return path, signature
+
+
+def model_mmap_enabled():
+    """
+    MODEL_MMAP=true builds interpreters from the model file instead of a copy
+    read into this process. The runtime maps the file read-only, so every
+    process on the node that loads it shares one set of page-cache pages.
+    """
+    return os.environ.get("MODEL_MMAP", "").lower() in ("1", "true", "yes")
+
+
+def resolve_model_file(model_path=None, model_bucket_id=None, model_file_id=None, metadata=None):
+    """
+    Find the model file to load and its identity.
+
+    Priority:
+    1. If model_path exists locally, use it
+    2. If model credentials provided, use the cached copy in /tmp for the
+       current version in Appwrite Storage, downloading it if needed
+    3. Raise error if neither available
+
+    metadata, if already fetched, saves resolve_storage_model a request.
+
+    Returns:
+        Tuple of (local model path, model identity string)
+    """
+    # Option 1: Load from local bundled path
+    if model_path and os.path.exists(model_path):
+        log(f"Using bundled model at: {model_path}")
+        stat = os.stat(model_path)
+        return model_path, f"{os.path.basename(model_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+    # Option 2: Versioned /tmp cache backed by Appwrite Storage
+    if model_bucket_id and model_file_id:
+        path, signature = resolve_storage_model(model_bucket_id, model_file_id, metadata)
+        return path, f"{model_bucket_id}/{model_file_id}@{signature}"
+
+    # No valid source
+    raise ValueError(
+        "No valid model source provided. Either provide a local model_path "
+        "or Appwrite Storage credentials (model_bucket_id, model_file_id)"
+    )
+
+
+def interpreter_options():
+    """
+    Interpreter settings from the environment.
+
+    TFLITE_NUM_THREADS: CPU threads per interpreter (default: runtime default)
+    TFLITE_USE_XNNPACK: set to "false" to disable the XNNPACK delegate
+    """
+    options = {}
+    num_threads = os.environ.get("TFLITE_NUM_THREADS")
+    if num_threads:
+        options["num_threads"] = int(num_threads)
+    if os.environ.get("TFLITE_USE_XNNPACK", "true").lower() in ("0", "false", "no"):
+        _tflite = _lazy_import_tflite()
+        options["experimental_op_resolver_type"] = _tflite.OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+    return options
+
+
+# Class names in the same order as model output.
+# IMPORTANT: This order MUST match the training data!
+# Order from balanced_class_info.json
+CLASS_NAMES = [
+    "Cold Wash",
+    "Cool Iron",
+    "Do Not Bleach",
+    "Do Not Dry Clean",
+    "Do Not Iron",
+    "Do Not Tumble Dry",
+    "Do Not Wash",
+    "Drip Dry",
+    "Dry Clean Except Trichloroethylene",
+    "Dry Flat",
+    "Dry in the Shade",
+    "Hand Wash",
+    "Hang Dry",
+    "Hot Iron",
+    "Hot Wash",
+    "Machine Wash",
+    "Machine Wash: Gentle / Delicate",
+    "Machine Wash: Permanent Press",
+    "Non-Chlorine Bleach If Needed",
+    "Normal Cycle Low Heat",
+    "Normal Cycle Medium Heat",
+    "Tumble Dry",
+    "Warm Iron",
+    "Warm Wash",
+    "Warm/Hot Wash",
+    "OK to Bleach",
+    "Dry Clean: Any Solvent (A)",
+    "Dry Clean: Petroleum Solvent Only",
+    "Dry Clean",
+    "Gentle Cycle Low Heat",
+    "Gentle Cycle Medium Heat",
+    "Gentle Cycle No Heat",
+    "No Heat Dry",
+    "Normal Cycle High Heat",
+    "Permanent Press Low Heat",
+    "Permanent Press Medium Heat",
+    "Permanent Press No Heat",
+    "No Steam",
+    "Sanitize Wash"
+]
+
+
+class PooledInterpreter:
+    """One TFLite interpreter plus the tensor bookkeeping needed to run it"""
+
+    def __init__(self, model_content, options, model_path=None):
+        _tflite = _lazy_import_tflite()
+        if model_content is None:
+            # The runtime maps the file read-only itself (see model_mmap_enabled)
+            self.interpreter = _tflite.Interpreter(model_path=model_path, **options)
+        else:
+            self.interpreter = _tflite.Interpreter(model_content=model_content, **options)
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()
+        self.output_details = self.interpreter.get_output_details()
+        self.input_index = self.input_details[0]['index']
+        self.output_index = self.output_details[0]['index']
+        self.batch_size = int(self.input_details[0]['shape'][0])
+        # Fully quantized models take integer pixels and emit integer scores;
+        # (scale, zero_point) maps between them and 0-1
+        self.input_quantization = self.input_details[0].get('quantization', (0.0, 0))
+        self.output_quantization = self.output_details[0].get('quantization', (0.0, 0))
+        # Upper bound on this interpreter's tensor memory, for the registry budget
+        _np = _lazy_import_numpy()
+        self.tensor_bytes = sum(
+            int(_np.prod(t['shape'])) * _np.dtype(t['dtype']).itemsize
+            for t in self.interpreter.get_tensor_details()
+        )
+
+    def set_batch_size(self, batch_size):
+        """
+        Resize the input tensor to hold batch_size images.
+
+        Resizing requires re-allocating tensors, so it is skipped when the
+        interpreter already has the requested batch size.
+        """
+        if batch_size == self.batch_size:
+            return
+
+        input_shape = list(self.input_details[0]['shape'])
+        input_shape[0] = batch_size
+        self.interpreter.resize_tensor_input(self.input_index, input_shape)
+        self.interpreter.allocate_tensors()
+
+        # Tensor details change after a resize
+        self.input_details = self.interpreter.get_input_details()
+        self.output_details = self.interpreter.get_output_details()
+        self.batch_size = batch_size
+
+    def run(self, images):
+        """
+        Classify a batch of preprocessed images with a single invoke().
+
+        Pixels are written straight into the interpreter's input buffer; the
+        tensor view is released before invoke(), as the runtime requires.
+
+        Returns:
+            Copy of the output tensor, shape (len(images), num_classes),
+            dequantized to float32 for models with integer outputs
+        """
+        self.set_batch_size(len(images))
+
+        input_view = self.interpreter.tensor(self.input_index)()
+        for slot, pixels in enumerate(images):
+            fill_input(input_view[slot], pixels, self.input_quantization)
+        del input_view
+
+        self.interpreter.invoke()
+
+        output = self.interpreter.get_tensor(self.output_index)
+        scale, zero_point = self.output_quantization
+        if scale and output.dtype.kind in "iu":
+            _np = _lazy_import_numpy()
+            return (output.astype(_np.float32) - zero_point) * _np.float32(scale)
+
+        # Make a COPY to avoid reference issues
+        return output.copy()
 
-        # Get input and output details
-        self._input_details = self._interpreter.get_input_details()
-        self._output_details = self._interpreter.get_output_details()
-        print(f"[INFO] Model loaded successfully", file=sys.stderr, flush=True)
 
-    def _preprocess_image(self, image_bytes):
+class InterpreterPool:
+    """
+    Bounded pool of interpreters sharing one in-memory model buffer.
+
+    The TFLite interpreter is not safe for concurrent set_tensor/invoke, so
+    each request checks out its own interpreter. Interpreters are created on
+    demand up to max_size; when all are busy, checkout() waits for one to be
+    returned. All interpreters are built from the same model bytes, so extra
+    interpreters only cost their tensor arenas, not another copy of the weights.
+    """
+
+    def __init__(self, model_content, max_size=1, options=None, model_path=None):
+        self.model_content = model_content
+        self.model_path = model_path
+        self.max_size = max(1, int(max_size))
+        self.options = options or {}
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+        # Build the first interpreter eagerly to validate the model and read its shape
+        first = self._create()
+        input_shape = first.input_details[0]['shape']
+        # Shape is [batch, height, width, channels]; PIL sizes are (width, height)
+        self.input_size = (int(input_shape[2]), int(input_shape[1]))
+        self.input_dtype = first.input_details[0]['dtype']
+        self._tensor_bytes = first.tensor_bytes
+        self._idle.put(first)
+
+    def _create(self):
+        interpreter = PooledInterpreter(self.model_content, self.options, self.model_path)
+        self._created += 1
+        return interpreter
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        """Borrow an interpreter for the duration of a with-block"""
+        try:
+            interpreter = self._idle.get_nowait()
+        except queue.Empty:
+            interpreter = None
+            with self._lock:
+                if self._created < self.max_size:
+                    interpreter = self._create()
+            if interpreter is None:
+                interpreter = self._idle.get(timeout=timeout)
+
+        try:
+            yield interpreter
+        finally:
+            self._idle.put(interpreter)
+
+    def warm(self):
         """
-        Preprocess image bytes for model inference.
-        Adjust target_size based on your model's expected input shape.
+        Create every interpreter up to max_size and invoke each once on a
+        blank input, so kernel preparation (e.g. XNNPACK weight packing) is
+        paid here rather than by the first real requests.
+
+        Returns:
+            Number of interpreters warmed
         """
-        # Lazy imports
-        _Image = _lazy_import_pil()
         _np = _lazy_import_numpy()
+        blank = _np.zeros((self.input_size[1], self.input_size[0], 3), dtype=_np.uint8)
+
+        interpreters = []
+        try:
+            while len(interpreters) < self.max_size:
+                try:
+                    interpreters.append(self._idle.get_nowait())
+                except queue.Empty:
+                    with self._lock:
+                        if self._created >= self.max_size:
+                            break
+                        interpreters.append(self._create())
+            for interpreter in interpreters:
+                interpreter.run([blank])
+        finally:
+            for interpreter in interpreters:
+                self._idle.put(interpreter)
+        return len(interpreters)
+
+    def memory_bytes(self):
+        """Estimated resident size: the shared model buffer plus each interpreter's tensors"""
+        if self.model_content is None:
+            model_bytes = os.path.getsize(self.model_path) if os.path.exists(self.model_path) else 0
+        else:
+            model_bytes = len(self.model_content)
+        return model_bytes + self._created * self._tensor_bytes
+
+    def stats(self):
+        """Number of interpreters created, idle and the pool bound"""
+        return {
+            "size": self._created,
+            "idle": self._idle.qsize(),
+            "maxSize": self.max_size,
+            "memoryBytes": self.memory_bytes(),
+        }
+
+
+class CareSymbolPredictor:
+    """
+    Per-source predictor that loads a model once and keeps it current.
+
+    Instances live in a registry keyed by model source (local path or
+    Storage file), so several models, e.g. A/B versions or the stages of a
+    ModelCascade, can be loaded side by side. The registry is bounded by
+    MODEL_MEMORY_BUDGET_MB (default 1024): when loading a model pushes the
+    estimated total over budget, the least recently used models are evicted.
+    Requests already holding an evicted model finish on it. Background work
+    such as shadow runs loads with evict=False: a model that does not fit
+    beside the loaded ones is unloaded again and ModelBudgetExceeded raised.
+
+    A model in Appwrite Storage is revalidated every
+    MODEL_REVALIDATE_INTERVAL seconds (default 300) with a cheap metadata
+    check, in the background. A new version is loaded next to the old one
+    and swapped in, so warm containers pick up new models without a restart
+    or a stall.
+    """
+
+    _instances = OrderedDict()
+    _instances_lock = threading.Lock()
+    _evictions = 0
+
+    def __new__(cls, model_path=None, model_bucket_id=None, model_file_id=None, evict=True):
+        source = (model_path, model_bucket_id, model_file_id)
+        with cls._instances_lock:
+            instance = cls._instances.get(source)
+            if instance is not None:
+                cls._instances.move_to_end(source)
+            else:
+                instance = super(CareSymbolPredictor, cls).__new__(cls)
+                instance._pool = None
+                instance._source = None
+                instance._validated_at = 0.0
+                instance._load_lock = threading.Lock()
+                instance.model_id = None
+                cls._instances[source] = instance
+
+        first_load = instance._pool is None
+        instance._ensure_model(model_path, model_bucket_id, model_file_id)
+        if first_load and evict:
+            cls._enforce_budget(keep=source)
+        elif first_load:
+            with cls._instances_lock:
+                total = cls._memory_total()
+                if total > cls._budget_bytes() and cls._instances.get(source) is instance:
+                    del cls._instances[source]
+            if total > cls._budget_bytes():
+                raise ModelBudgetExceeded(
+                    f"Model {instance.model_id} does not fit the memory budget next to the loaded models"
+                )
+        return instance
+
+    @staticmethod
+    def _budget_bytes():
+        return float(os.environ.get("MODEL_MEMORY_BUDGET_MB") or 1024) * 1024 * 1024
+
+    @classmethod
+    def _memory_total(cls):
+        """Estimated memory of every loaded model; call with _instances_lock held"""
+        return sum(i._pool.memory_bytes() for i in cls._instances.values() if i._pool is not None)
+
+    @classmethod
+    def _enforce_budget(cls, keep):
+        """Evict least recently used models until the estimate fits the budget"""
+        budget = cls._budget_bytes()
+        with cls._instances_lock:
+            total = cls._memory_total()
+            for source in list(cls._instances):
+                if total <= budget:
+                    break
+                if source == keep:
+                    continue
+                instance = cls._instances.pop(source)
+                if instance._pool is not None:
+                    total -= instance._pool.memory_bytes()
+                    log(f"Evicting model {instance.model_id} to stay within the memory budget")
+                cls._evictions += 1
+                increment("model_evictions")
+
+    @classmethod
+    def registry_stats(cls):
+        """Loaded models in LRU order (least recent first), estimated memory and budget"""
+        models = cls.stats()
+        return {
+            "models": models,
+            "memoryBytes": sum(m["interpreterPool"]["memoryBytes"] for m in models),
+            "budgetBytes": int(cls._budget_bytes()),
+            "evictions": cls._evictions,
+        }
 
-        # Open image from bytes
-        img = _Image.open(BytesIO(image_bytes))
-        print(f"[DEBUG] Original image size: {img.size}, mode: {img.mode}", file=sys.stderr, flush=True)
+    @classmethod
+    def _loaded(cls):
+        with cls._instances_lock:
+            return [instance for instance in cls._instances.values() if instance._pool is not None]
 
-        # Convert to RGB if needed
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
+    @classmethod
+    def input_size(cls):
+        """Largest (width, height) any loaded model expects, or None before the first load"""
+        sizes = [instance._pool.input_size for instance in cls._loaded()]
+        return max(sizes) if sizes else None
 
-        # Get model's expected input shape from input_details
-        input_shape = self._input_details[0]['shape']
-        # Shape is typically [batch, height, width, channels]
-        target_size = (input_shape[1], input_shape[2])
-        print(f"[DEBUG] Model expects input shape: {input_shape}, resizing to: {target_size}", file=sys.stderr, flush=True)
-        img = img.resize(target_size)
+    @classmethod
+    def stats(cls):
+        """Identity and interpreter pool state of each loaded model"""
+        return [
+            {"modelId": instance.model_id, "interpreterPool": instance._pool.stats()}
+            for instance in cls._loaded()
+        ]
+
+    def _ensure_model(self, model_path=None, model_bucket_id=None, model_file_id=None):
+        """
+        Load the model on first use or on a source change, and check for a
+        new version when it is stale.
 
-        # Convert to array
-        img_array = _np.array(img)
+        Only the first load blocks. Once a model is loaded, a stale one keeps
+        serving while a background thread revalidates and, if needed, reloads
+        it; callers that find a check already running do not wait for it.
+        """
+        source = (model_path, model_bucket_id, model_file_id)
+        if self._pool is None or self._source != source:
+            with self._load_lock:
+                if self._pool is None or self._source != source:
+                    self._load_model(model_path, model_bucket_id, model_file_id)
+            return
+
+        interval = float(os.environ.get("MODEL_REVALIDATE_INTERVAL") or 300)
+        if time.monotonic() - self._validated_at < interval:
+            return
+        if not self._load_lock.acquire(blocking=False):
+            return
+        try:
+            threading.Thread(
+                target=self._revalidate_in_background, args=source,
+                name="model-revalidate", daemon=True
+            ).start()
+        except Exception:
+            self._load_lock.release()
+            raise
 
-        # Check model's expected input type from input_details
-        expected_dtype = self._input_details[0]['dtype']
-        print(f"[DEBUG] Model expects dtype: {expected_dtype}", file=sys.stderr, flush=True)
+    def _revalidate_in_background(self, model_path=None, model_bucket_id=None, model_file_id=None):
+        """Revalidate with _load_lock held by the caller; releases it when done"""
+        try:
+            self._revalidate(model_path, model_bucket_id, model_file_id)
+        except Exception as e:
+            # Keep serving the loaded model; try again next interval
+            log(f"Model revalidation failed: {str(e)}", "WARN")
+            self._validated_at = time.monotonic()
+        finally:
+            self._load_lock.release()
 
-        if expected_dtype == _np.uint8:
-            # Model expects UINT8 (0-255), keep as-is
-            img_array = img_array.astype('uint8')
-            print(f"[DEBUG] Using UINT8 input, range: [{img_array.min()}, {img_array.max()}]", file=sys.stderr, flush=True)
+    def _resolve_model(self, model_path=None, model_bucket_id=None, model_file_id=None, metadata=None):
+        """Find the model file to load and its identity (see resolve_model_file)"""
+        return resolve_model_file(model_path, model_bucket_id, model_file_id, metadata)
+
+    def _revalidate(self, model_path=None, model_bucket_id=None, model_file_id=None):
+        """Reload the model if the bundled file or the Storage version changed"""
+        metadata = None
+        if model_path and os.path.exists(model_path):
+            stat = os.stat(model_path)
+            changed = self.model_id != f"{os.path.basename(model_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+        else:
+            metadata = fetch_model_metadata(model_bucket_id, model_file_id)
+            changed = self.model_id != f"{model_bucket_id}/{model_file_id}@{metadata.get('signature')}"
+
+        if changed:
+            log("Model changed, loading new version")
+            self._load_model(model_path, model_bucket_id, model_file_id, metadata)
         else:
-            # Model expects FLOAT32, normalize to 0.0-1.0
-            img_array = img_array.astype('float32') / 255.0
-            print(f"[DEBUG] Using FLOAT32 input, range: [{img_array.min():.3f}, {img_array.max():.3f}]", file=sys.stderr, flush=True)
+            self._validated_at = time.monotonic()
+
+    def _load_model(self, model_path=None, model_bucket_id=None, model_file_id=None, metadata=None):
+        """
+        Load the TensorFlow Lite model from local path or Appwrite Storage
+        and swap it in.
+
+        metadata is the Storage metadata if _revalidate already fetched it.
+        The new interpreter pool is fully built before it replaces the current
+        one, so in-flight requests finish on the old model.
+        """
+        final_model_path, model_id = self._resolve_model(model_path, model_bucket_id, model_file_id, metadata)
+
+        # Now load the TFLite model. The bytes are read once and shared by
+        # every interpreter in the pool; with MODEL_MMAP the file is mapped
+        # instead, and shared with every other process mapping it too.
+        log(f"Loading TensorFlow Lite model from {final_model_path}...")
+        if model_mmap_enabled():
+            model_content = None
+        else:
+            with open(final_model_path, "rb") as f:
+                model_content = f.read()
+
+        increment("model_loads")
+        pool_size = int(os.environ.get("INTERPRETER_POOL_SIZE") or 1)
+        pool = InterpreterPool(
+            model_content, max_size=pool_size, options=interpreter_options(), model_path=final_model_path
+        )
+        log(f"Model input size: {pool.input_size}, dtype: {pool.input_dtype.__name__}, pool size: {pool_size}")
+
+        # Requests that already hold the old pool finish on the old model
+        self._pool = pool
+        # Identifies the loaded model in result cache keys
+        self.model_id = model_id
+        self._source = (model_path, model_bucket_id, model_file_id)
+        self._validated_at = time.monotonic()
+        log(f"Model loaded successfully ({model_id})")
+
+    def warmup(self):
+        """Run a synthetic inference on every pooled interpreter; returns how many"""
+        return self._pool.warm()
+
+    def scores(self, image_bytes, timings=None, tiles=0, report=None):
+        """
+        Run inference on image bytes and return the raw per-class scores.
+
+        Args:
+            image_bytes: Raw image file bytes
+            timings: Optional telemetry.Timings to record stage spans into
+            tiles: Most model inputs to split the image into (see
+                decode_tiles); 0 or 1 scores the whole image as one input
+            report: Optional dict; receives 'tiles', the number of inputs
+                scored, when the image was tiled
+
+        Returns:
+            numpy array of shape (num_classes,)
+        """
+        timings = timings or Timings()
+        pool = self._pool
 
-        # Add batch dimension
-        img_array = _np.expand_dims(img_array, axis=0)
-        print(f"[DEBUG] Final array shape: {img_array.shape}", file=sys.stderr, flush=True)
+        # Preprocess
+        with timings.span("preprocess"):
+            if tiles > 1:
+                batch = decode_tiles(image_bytes, pool.input_size, tiles, tile_settings()[1])
+            else:
+                batch = [decode_image(image_bytes, pool.input_size)]
 
-        return img_array
+        # Run TFLite inference on an interpreter of our own; every tile
+        # goes through the same invoke()
+        with timings.span("invoke"):
+            with pool.checkout() as interpreter:
+                predictions = interpreter.run(batch)
+
+        if len(batch) > 1:
+            increment("tiles.images")
+            increment("tiles.inputs", len(batch))
+            if report is not None:
+                report["tiles"] = len(batch)
+            # A label is as present as in the tile that shows it best
+            predictions = predictions.max(axis=0)
+        else:
+            # predictions shape: (1, num_classes)
+            predictions = predictions[0]
+        if log_enabled("DEBUG"):
+            log(f"Raw predictions shape: {predictions.shape}, top 5 values: {sorted(predictions, reverse=True)[:5]}", "DEBUG")
+        return predictions
 
-    def predict(self, image_bytes, top_k=5, threshold=0.1):
+    def predict(self, image_bytes, top_k=5, threshold=0.1, timings=None, report=None, tiles=0):
         """
         Run inference on image bytes using TFLite.
 
@@ -200,24 +1040,113 @@ class CareSymbolPredictor:
             image_bytes: Raw image file bytes
             top_k: Number of top predictions to return
             threshold: Minimum confidence threshold
+            timings: Optional telemetry.Timings to record stage spans into
+            report: Optional dict for details about how the answer was
+                produced; a single model only adds 'tiles' (see scores()
+                and ModelCascade)
+            tiles: Most model inputs to tile the image into (see scores())
 
         Returns:
             List of dicts with 'label' and 'confidence' keys
         """
-        # Preprocess
-        img_array = self._preprocess_image(image_bytes)
+        timings = timings or Timings()
+        predictions = self.scores(image_bytes, timings, tiles=tiles, report=report)
+
+        with timings.span("postprocess"):
+            return self._postprocess(predictions, top_k, threshold)
+
+    def scores_batch(self, images, max_batch_size=16, timings=None):
+        """
+        Run inference on several images with one interpreter invoke per chunk.
+
+        Images that fail to decode are reported individually and do not
+        affect the rest of the batch. Images are split into chunks of at most
+        max_batch_size, each decoded just before its own batched invoke(),
+        so only one chunk of decoded pixels is held at a time.
+
+        Args:
+            images: List of raw image file bytes
+            max_batch_size: Maximum number of images per invoke()
+            timings: Optional telemetry.Timings to record stage spans into
+
+        Returns:
+            List with one entry per input image, in order. Each entry is a
+            dict with either 'scores' (numpy array of shape (num_classes,))
+            or 'error' (message string).
+        """
+        timings = timings or Timings()
+        pool = self._pool
+        outcomes = [None] * len(images)
+
+        max_batch_size = max(1, int(max_batch_size))
+        for start in range(0, len(images), max_batch_size):
+            # Decode the chunk first so a bad file only fails itself
+            chunk = []
+            with timings.span("preprocess"):
+                for i in range(start, min(start + max_batch_size, len(images))):
+                    try:
+                        chunk.append((i, decode_image(images[i], pool.input_size)))
+                    except Exception as e:
+                        log(f"Failed to preprocess image {i}: {str(e)}", "WARN")
+                        outcomes[i] = {"error": f"Failed to preprocess image: {str(e)}"}
+            if not chunk:
+                continue
 
-        # Run TFLite inference
-        self._interpreter.set_tensor(self._input_details[0]['index'], img_array)
-        self._interpreter.invoke()
+            indices = [i for i, _ in chunk]
+            try:
+                log(f"Running batched inference on {len(chunk)} images")
 
-        # Get predictions - make a COPY to avoid reference issues
-        predictions = self._interpreter.get_tensor(self._output_details[0]['index']).copy()
+                with timings.span("invoke"), pool.checkout() as interpreter:
+                    # predictions shape: (batch, num_classes)
+                    predictions = interpreter.run([pixels for _, pixels in chunk])
+            except Exception as e:
+                log(f"Batched inference failed: {str(e)}", "ERROR")
+                for i in indices:
+                    outcomes[i] = {"error": f"Inference failed: {str(e)}"}
+                continue
 
-        # predictions shape: (1, num_classes)
-        predictions = predictions[0]
-        print(f"[DEBUG] Raw predictions shape: {predictions.shape}, top 5 values: {sorted(predictions, reverse=True)[:5]}", file=sys.stderr, flush=True)
+            for row, i in enumerate(indices):
+                outcomes[i] = {"scores": predictions[row]}
 
+        return outcomes
+
+    def scores_pixels(self, arrays, timings=None):
+        """
+        Score images that were already decoded to the model input size
+        (see decode_image), e.g. in worker processes, with one invoke.
+
+        Returns:
+            numpy array of shape (len(arrays), num_classes)
+        """
+        timings = timings or Timings()
+        with timings.span("invoke"), self._pool.checkout() as interpreter:
+            return interpreter.run(arrays)
+
+    def labels(self, scores, top_k=5, threshold=0.1):
+        """Label/confidence predictions for one row of scores"""
+        return self._postprocess(scores, top_k, threshold)
+
+    def predict_batch(self, images, top_k=5, threshold=0.1, max_batch_size=16, timings=None):
+        """
+        Batched counterpart of predict(); see scores_batch() for how images
+        are chunked and how failures are isolated.
+
+        Returns:
+            List with one entry per input image, in order. Each entry is a
+            dict with either 'predictions' (list of label/confidence dicts)
+            or 'error' (message string).
+        """
+        timings = timings or Timings()
+        outcomes = self.scores_batch(images, max_batch_size=max_batch_size, timings=timings)
+
+        with timings.span("postprocess"):
+            for outcome in outcomes:
+                if "scores" in outcome:
+                    outcome["predictions"] = self._postprocess(outcome.pop("scores"), top_k, threshold)
+        return outcomes
+
+    def _postprocess(self, predictions, top_k, threshold):
+        """Turn one row of model scores into sorted, thresholded label predictions"""
         # Get class names
         class_names = self._get_class_names()
 
@@ -227,11 +1156,13 @@ class CareSymbolPredictor:
             if confidence >= threshold:
                 label = class_names[idx] if idx < len(class_names) else f"Class_{idx}"
                 results.append({
+                    "classIndex": idx,
                     "label": label,
                     "confidence": float(confidence)
                 })
 
-        print(f"[DEBUG] Found {len(results)} predictions above threshold {threshold}", file=sys.stderr, flush=True)
+        if log_enabled("DEBUG"):
+            log(f"Found {len(results)} predictions above threshold {threshold}", "DEBUG")
 
         # Sort by confidence descending
         results.sort(key=lambda x: x["confidence"], reverse=True)
@@ -240,52 +1171,137 @@ class CareSymbolPredictor:
         return results[:top_k]
 
     def _get_class_names(self):
+        """Class names in model output order (see CLASS_NAMES)"""
+        return CLASS_NAMES
+
+
+# Which cascade stage answered, across all requests in this process
+_cascade_answers = {}
+_cascade_lock = threading.Lock()
+
+
+def cascade_stats():
+    """How often each cascade stage answered, and the escalation rate"""
+    with _cascade_lock:
+        answers = dict(_cascade_answers)
+    total = sum(answers.values())
+    first = next(iter(answers.values()), 0)
+    return {
+        "answeredBy": answers,
+        "requests": total,
+        "escalationRate": round(1 - first / total, 4) if total else None,
+    }
+
+
+class ModelCascade:
+    """
+    Ordered cascade of predictors: cheapest first, full model last.
+
+    Each image goes to the first stage. Its answer is accepted when it is
+    confident: the top score clears threshold + margin and no class scores
+    within margin of the threshold, where a small model is most likely to
+    flip a label. Otherwise the image escalates to the next stage. The last
+    stage always answers.
+
+    Offers the same predict/predict_batch interface as CareSymbolPredictor,
+    so callers do not need to know whether a cascade is configured.
+    """
+
+    def __init__(self, stages, margin=0.15):
         """
-        Return the list of class names in the same order as model output.
+        Args:
+            stages: List of (name, CareSymbolPredictor), cheapest first
+            margin: Confidence margin around the threshold (0-1)
+        """
+        if not stages:
+            raise ValueError("A model cascade needs at least one stage")
+        self.stages = list(stages)
+        self.margin = float(margin)
+        # Results depend on every stage and the margin, so all go into cache keys
+        self.model_id = " > ".join(p.model_id for _, p in self.stages) + f" @margin={self.margin}"
+
+        with _cascade_lock:
+            for name, _ in self.stages:
+                _cascade_answers.setdefault(name, 0)
+
+    def is_confident(self, scores, threshold):
+        """Whether a stage's scores are decisive enough to skip the next stage"""
+        _np = _lazy_import_numpy()
+        if float(scores.max()) < threshold + self.margin:
+            return False
+        return not bool(_np.any(_np.abs(scores - threshold) < self.margin))
+
+    def _answered(self, name, count=1):
+        with _cascade_lock:
+            _cascade_answers[name] = _cascade_answers.get(name, 0) + count
+
+    def warmup(self):
+        return sum(predictor.warmup() for _, predictor in self.stages)
 
-        IMPORTANT: This order MUST match the training data!
-        Order from balanced_class_info.json
+    def predict(self, image_bytes, top_k=5, threshold=0.1, timings=None, report=None, tiles=0):
         """
-        return [
-            "Cold Wash",
-            "Cool Iron",
-            "Do Not Bleach",
-            "Do Not Dry Clean",
-            "Do Not Iron",
-            "Do Not Tumble Dry",
-            "Do Not Wash",
-            "Drip Dry",
-            "Dry Clean Except Trichloroethylene",
-            "Dry Flat",
-            "Dry in the Shade",
-            "Hand Wash",
-            "Hang Dry",
-            "Hot Iron",
-            "Hot Wash",
-            "Machine Wash",
-            "Machine Wash: Gentle / Delicate",
-            "Machine Wash: Permanent Press",
-            "Non-Chlorine Bleach If Needed",
-            "Normal Cycle Low Heat",
-            "Normal Cycle Medium Heat",
-            "Tumble Dry",
-            "Warm Iron",
-            "Warm Wash",
-            "Warm/Hot Wash",
-            "OK to Bleach",
-            "Dry Clean: Any Solvent (A)",
-            "Dry Clean: Petroleum Solvent Only",
-            "Dry Clean",
-            "Gentle Cycle Low Heat",
-            "Gentle Cycle Medium Heat",
-            "Gentle Cycle No Heat",
-            "No Heat Dry",
-            "Normal Cycle High Heat",
-            "Permanent Press Low Heat",
-            "Permanent Press Medium Heat",
-            "Permanent Press No Heat",
-            "No Steam",
-            "Sanitize Wash"
-        ]
+        Run the cascade on one image, tiled the same way in every stage.
+
+        If report is a dict, it receives 'stage' (name of the answering
+        stage), 'escalated' and each tried stage's top score under 'stages'.
+        """
+        timings = timings or Timings()
+        tried = []
+        for position, (name, predictor) in enumerate(self.stages):
+            with timings.span(f"cascade.{name}"):
+                scores = predictor.scores(image_bytes, timings, tiles=tiles, report=report)
+            tried.append({"name": name, "topConfidence": round(float(scores.max()), 4)})
+
+            last = position == len(self.stages) - 1
+            if last or self.is_confident(scores, threshold):
+                break
+
+        self._answered(name)
+        if report is not None:
+            report.update({"stage": name, "escalated": len(tried) > 1, "stages": tried})
+
+        with timings.span("postprocess"):
+            return predictor._postprocess(scores, top_k, threshold)
+
+    def predict_batch(self, images, top_k=5, threshold=0.1, max_batch_size=16, timings=None):
+        """
+        Run the cascade on several images. Each stage runs one batched pass
+        over the images still unresolved, so escalation costs one extra
+        batched invoke rather than one per image.
+
+        Returns:
+            As CareSymbolPredictor.predict_batch, plus 'stage' on each
+            successful entry
+        """
+        timings = timings or Timings()
+        outcomes = [None] * len(images)
+        pending = list(range(len(images)))
+
+        for position, (name, predictor) in enumerate(self.stages):
+            last = position == len(self.stages) - 1
+            with timings.span(f"cascade.{name}"):
+                results = predictor.scores_batch(
+                    [images[i] for i in pending], max_batch_size=max_batch_size, timings=timings
+                )
+
+            escalate = []
+            answered = 0
+            with timings.span("postprocess"):
+                for i, result in zip(pending, results):
+                    if "error" in result:
+                        outcomes[i] = result
+                    elif last or self.is_confident(result["scores"], threshold):
+                        outcomes[i] = {
+                            "predictions": predictor._postprocess(result["scores"], top_k, threshold),
+                            "stage": name,
+                        }
+                        answered += 1
+                    else:
+                        escalate.append(i)
 
+            self._answered(name, answered)
+            pending = escalate
+            if not pending:
+                break
 
+        return outcomes
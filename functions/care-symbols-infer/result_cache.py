@@ -0,0 +1,192 @@
+"""
+Content-addressed cache for inference results.
+The same tag photo is often submitted more than once (client retries, the
+Results page reloading, duplicate uploads). Results are keyed by a hash of the
+image bytes plus everything else that affects the output, so a repeat request
+skips preprocessing and inference entirely.
+Entries live in an in-memory LRU and can optionally be persisted to /tmp so
+they survive the interpreter being recreated inside a warm container. The
+disk copy is bounded too: past max_disk_entries files, the least recently
+used ones are deleted.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    from .telemetry import log  # when loaded as package "function"
+except ImportError:
+    from telemetry import log   # fallback for local runs
+
+
+class ResultCache:
+    """Thread-safe LRU cache of prediction lists with optional disk persistence"""
+
+    # Pruning the disk copy goes down to this fraction of max_disk_entries,
+    # so the directory is listed once per many writes rather than every one
+    DISK_PRUNE_TO = 0.9
+
+    def __init__(self, max_entries=256, persist_dir=None, max_disk_entries=4096):
+        self.max_entries = max_entries
+        self.persist_dir = persist_dir
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_entries = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.persist_dir:
+            os.makedirs(self.persist_dir, exist_ok=True)
+            self._disk_entries = len(self._disk_files())
+
+    @staticmethod
+    def make_key(content_hash, model_id, top_k, threshold):
+        """Build a cache key from the image hash, model identity and request parameters"""
+        return f"{content_hash}:{model_id}:{top_k}:{float(threshold)}"
+
+    def _disk_path(self, key):
+        # Keys contain ':' and '/', which are not safe in file names everywhere
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.persist_dir, f"{name}.json")
+
+    def get(self, key):
+        """Return cached predictions for key, or None on a miss"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        if self.persist_dir:
+            try:
+                with open(self._disk_path(key), "r") as f:
+                    stored = json.load(f)
+                if stored.get("key") == key:
+                    predictions = stored["predictions"]
+                    # The modification time orders entries for disk pruning
+                    os.utime(self._disk_path(key))
+                    with self._lock:
+                        self.hits += 1
+                        self.disk_hits += 1
+                    self._remember(key, predictions)
+                    return predictions
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                log(f"Ignoring unreadable result cache entry: {str(e)}", "WARN")
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, predictions):
+        """Store predictions for key, evicting the least recently used entry if full"""
+        self._remember(key, predictions)
+
+        if self.persist_dir:
+            path = self._disk_path(key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                existed = os.path.exists(path)
+                with open(tmp_path, "w") as f:
+                    json.dump({"key": key, "predictions": predictions}, f)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                log(f"Failed to persist result cache entry: {str(e)}", "WARN")
+                return
+
+            if not existed:
+                with self._disk_lock:
+                    self._disk_entries += 1
+                    if self._disk_entries > self.max_disk_entries:
+                        self._prune_disk()
+
+    def _disk_files(self):
+        return [name for name in os.listdir(self.persist_dir) if name.endswith(".json")]
+
+    def _prune_disk(self):
+        """Delete the least recently used disk entries; call with _disk_lock held"""
+        entries = []
+        for name in self._disk_files():
+            path = os.path.join(self.persist_dir, name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        entries.sort()
+
+        keep = int(self.max_disk_entries * self.DISK_PRUNE_TO)
+        removed = 0
+        for _, path in entries[:max(0, len(entries) - keep)]:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        self._disk_entries = len(entries) - removed
+        log(f"Pruned {removed} result cache entries from {self.persist_dir}")
+
+    def _remember(self, key, predictions):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = predictions
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all in-memory entries and reset the counters (disk entries are kept)"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return hit/miss counters and the current number of in-memory entries"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "diskHits": self.disk_hits,
+                "misses": self.misses,
+                "hitRate": (self.hits / lookups) if lookups else 0.0,
+                "entries": len(self._entries),
+                "maxEntries": self.max_entries,
+                "persistent": bool(self.persist_dir),
+                "diskEntries": self._disk_entries,
+                "maxDiskEntries": self.max_disk_entries if self.persist_dir else None,
+            }
+
+
+_result_cache = None
+
+
+def get_result_cache():
+    """
+    Return the process-wide result cache, created on first use.
+
+    Configured with RESULT_CACHE_SIZE (in-memory entries, default 256, 0 to
+    disable), RESULT_CACHE_DIR (directory for persisted entries, e.g.
+    /tmp/care_symbols_results; unset keeps the cache in memory only) and
+    RESULT_CACHE_DISK_SIZE (persisted entries, default 4096).
+    Returns None when caching is disabled.
+    """
+    global _result_cache
+    if _result_cache is None:
+        max_entries = int(os.environ.get("RESULT_CACHE_SIZE") or 256)
+        persist_dir = os.environ.get("RESULT_CACHE_DIR") or None
+        if max_entries <= 0 and not persist_dir:
+            return None
+        max_disk_entries = int(os.environ.get("RESULT_CACHE_DISK_SIZE") or 4096)
+        _result_cache = ResultCache(
+            max_entries=max_entries, persist_dir=persist_dir, max_disk_entries=max_disk_entries
+        )
+    return _result_cache
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Standalone HTTP server for running the predictor outside the Appwrite runtime.
+
+Accepts the same JSON (or multipart) bodies as the Appwrite Function on
+POST / and answers with the same response bodies. Single-image requests
+arriving within a short window are grouped into one batched invoke(): the
+batcher waits up to --max-wait-ms for up to --max-batch images, so under
+concurrent load several requests share each interpreter call.
+
+Backpressure: at most --max-queue requests are admitted at once; beyond that
+the server answers 503 with Retry-After instead of queueing unboundedly.
+GET /health reports liveness, queue depth and the loaded models. GET
+/metadata serves the label metadata bundle with ETag revalidation.
+
+The Appwrite environment variables (APPWRITE_ENDPOINT, BUCKET_ID, MODEL_PATH,
+...) configure it exactly as they configure the function.
+
+Usage:
+    python server.py --port 8080
+    python server.py --max-batch 16 --max-wait-ms 5 --max-queue 256 --warmup
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Package-relative import when imported as a package, plain import when run as a script
+try:
+    from .main import metadata_response, process
+    from .predict import CareSymbolPredictor
+    from .telemetry import Timings, increment, log, observe
+except ImportError:
+    from main import metadata_response, process
+    from predict import CareSymbolPredictor
+    from telemetry import Timings, increment, log, observe
+
+# Largest request body accepted; inline images have their own, smaller cap
+MAX_BODY_BYTES = 8 * 1024 * 1024
+
+STATUS_TEXT = {
+    200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    411: "Length Required", 413: "Payload Too Large", 500: "Internal Server Error",
+    502: "Bad Gateway", 503: "Service Unavailable",
+}
+
+
+class ServerRequest:
+    """The attributes of an Appwrite request that main.process reads"""
+
+    def __init__(self, body, headers):
+        self.body_binary = body
+        self.body = body.decode("utf-8", "replace")
+        self.headers = headers
+
+
+class MicroBatcher:
+    """
+    Groups concurrent single-image inferences into batched invokes.
+
+    Worker threads call infer() (the hook handle_request accepts), which
+    hands the image to the event loop and blocks until its batch has run.
+    The loop collects up to max_batch images or waits at most max_wait_ms
+    after the first one, whichever comes first, then runs predict_batch on
+    an inference thread. Up to `parallel` batches run at once, matching the
+    interpreter pool size.
+    """
+
+    def __init__(self, loop, max_batch=16, max_wait_ms=5.0, parallel=1):
+        self.loop = loop
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(max(1, int(parallel)))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(parallel)), thread_name_prefix="invoke")
+
+    def infer(self, predictor, image_bytes, top_k, threshold, timings, report):
+        """handle_request's infer hook; runs on a request worker thread"""
+        future = asyncio.run_coroutine_threadsafe(
+            self._submit(predictor, image_bytes, top_k, threshold, timings), self.loop
+        )
+        outcome = future.result()
+        if "error" in outcome:
+            raise RuntimeError(outcome["error"])
+        if outcome.get("stage"):
+            report["stage"] = outcome["stage"]
+        return outcome["predictions"]
+
+    async def _submit(self, predictor, image_bytes, top_k, threshold, timings):
+        done = self.loop.create_future()
+        await self.queue.put((predictor, image_bytes, top_k, threshold, timings, time.perf_counter(), done))
+        return await done
+
+    async def run(self):
+        """Collect and dispatch batches until cancelled"""
+        while True:
+            await self._slots.acquire()
+            batch = [await self.queue.get()]
+            deadline = self.loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - self.loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            asyncio.ensure_future(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        try:
+            # Items can differ in model (cascade on/off), topK or threshold
+            groups = {}
+            for item in batch:
+                predictor, _, top_k, threshold = item[:4]
+                groups.setdefault((predictor.model_id, top_k, threshold), []).append(item)
+
+            for items in groups.values():
+                await self._run_group(items)
+        finally:
+            self._slots.release()
+
+    async def _run_group(self, items):
+        predictor, _, top_k, threshold = items[0][:4]
+        started = time.perf_counter()
+        for item in items:
+            item[4].record("batch_wait", (started - item[5]) * 1000)
+
+        increment("server.batches")
+        increment("server.batched_images", len(items))
+        batch_timings = Timings()
+        try:
+            outcomes = await self.loop.run_in_executor(
+                self._executor,
+                lambda: predictor.predict_batch(
+                    [item[1] for item in items], top_k=top_k, threshold=threshold,
+                    max_batch_size=self.max_batch, timings=batch_timings
+                )
+            )
+        except Exception as e:
+            outcomes = [{"error": f"Inference failed: {str(e)}"}] * len(items)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        observe("server.batch", elapsed_ms)
+        for item, outcome in zip(items, outcomes):
+            item[4].record("batch_infer", elapsed_ms)
+            if not item[6].done():
+                item[6].set_result(outcome)
+
+
+class InferenceServer:
+    """asyncio HTTP/1.1 front end with admission control"""
+
+    def __init__(self, max_batch=16, max_wait_ms=5.0, max_queue=256, parallel=1):
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.max_queue = max(1, int(max_queue))
+        self.parallel = parallel
+        self.in_flight = 0
+        self.batcher = None
+        # One thread per admitted request: downloads and enrichment block
+        self._workers = ThreadPoolExecutor(max_workers=self.max_queue, thread_name_prefix="request")
+
+    async def start(self, host="0.0.0.0", port=8080):
+        loop = asyncio.get_running_loop()
+        self.batcher = MicroBatcher(loop, self.max_batch, self.max_wait_ms, self.parallel)
+        self._batcher_task = asyncio.ensure_future(self.batcher.run())
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server
+
+    def health(self):
+        models = CareSymbolPredictor.stats()
+        return {
+            "status": "ok",
+            "modelLoaded": bool(models),
+            "inFlight": self.in_flight,
+            "queueDepth": self.batcher.queue.qsize() if self.batcher else 0,
+            "maxQueue": self.max_queue,
+            "models": models,
+        }
+
+    async def _route(self, method, path, headers, body):
+        """Return (status, response dict, extra headers)"""
+        path = path.split("?", 1)[0]
+        if path == "/health":
+            if method != "GET":
+                return 405, {"success": False, "error": "Use GET"}, {}
+            return 200, self.health(), {}
+
+        if path == "/metadata":
+            if method != "GET":
+                return 405, {"success": False, "error": "Use GET"}, {}
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._workers, metadata_response, headers)
+
+        if path not in ("/", "/infer"):
+            return 404, {"success": False, "error": "Not found"}, {}
+        if method != "POST":
+            return 405, {"success": False, "error": "Use POST"}, {}
+
+        # Admission control: refuse rather than queue without bound
+        if self.in_flight >= self.max_queue:
+            increment("server.rejected")
+            return 503, {"success": False, "error": "Server overloaded, retry later"}, {"Retry-After": "1"}
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                self._workers, process, ServerRequest(body, headers), self.batcher.infer
+            )
+        finally:
+            self.in_flight -= 1
+        return 200, result, {}
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"success": False, "error": "Malformed request line"}, {}, False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                if "chunked" in headers.get("transfer-encoding", "").lower():
+                    await self._respond(writer, 411, {"success": False, "error": "Send Content-Length"}, {}, False)
+                    break
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {"success": False, "error": "Request body too large"}, {}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, result, extra = await self._route(method, target, headers, body)
+                await self._respond(writer, status, result, extra, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, result, extra_headers, keep_alive):
+        # 304s carry no body
+        body = json.dumps(result).encode("utf-8") if result is not None else b""
+        lines = [
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'OK')}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        lines += [f"{name}: {value}" for name, value in extra_headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+
+async def serve(args):
+    server = InferenceServer(
+        max_batch=args.max_batch, max_wait_ms=args.max_wait_ms,
+        max_queue=args.max_queue, parallel=args.parallel
+    )
+
+    if args.warmup:
+        result = process(ServerRequest(b'{"action": "warmup"}', {}))
+        log(f"Warm-up: {json.dumps(result)}")
+
+    listener = await server.start(args.host, args.port)
+    log(f"Serving on {args.host}:{args.port} (max batch {args.max_batch}, "
+        f"max wait {args.max_wait_ms}ms, max queue {args.max_queue})")
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.environ.get("SERVER_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("SERVER_PORT") or 8080))
+    parser.add_argument("--max-batch", type=int, default=int(os.environ.get("SERVER_MAX_BATCH") or 16),
+                        help="Most images per batched invoke")
+    parser.add_argument("--max-wait-ms", type=float, default=float(os.environ.get("SERVER_MAX_WAIT_MS") or 5),
+                        help="Longest a request waits for others to share its invoke")
+    parser.add_argument("--max-queue", type=int, default=int(os.environ.get("SERVER_MAX_QUEUE") or 256),
+                        help="Requests admitted at once before answering 503")
+    parser.add_argument("--parallel", type=int, default=int(os.environ.get("INTERPRETER_POOL_SIZE") or 1),
+                        help="Batches run at once (defaults to INTERPRETER_POOL_SIZE)")
+    parser.add_argument("--warmup", action="store_true", help="Load the model before accepting requests")
+    args = parser.parse_args()
+
+    # Every admitted request runs its download, model and metadata stages at
+    # once; size the shared stage pool for them unless configured
+    os.environ.setdefault("STAGE_CONCURRENCY", str(2 * args.max_queue))
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Logging and latency instrumentation for the inference function.
+log() writes level-tagged lines to stderr and drops anything below LOG_LEVEL
+(DEBUG, INFO, WARN or ERROR; default INFO). Timings records per-stage spans for
+one request and feeds process-wide histograms, which live as long as the warm
+container and are reported by snapshot().
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARN": 30, "WARNING": 30, "ERROR": 40}
+
+# Samples kept per histogram; percentiles describe this recent window
+HISTOGRAM_WINDOW = 1024
+
+
+def log_enabled(level):
+    """Whether messages at level pass the LOG_LEVEL gate"""
+    threshold = LEVELS.get(os.environ.get("LOG_LEVEL", "INFO").upper(), 20)
+    return LEVELS.get(level, 20) >= threshold
+
+
+def log(message, level="INFO"):
+    """Simple logging helper"""
+    if log_enabled(level):
+        print(f"[{level}] {message}", file=sys.stderr, flush=True)
+
+
+class Histogram:
+    """Count, sum and a sliding window of samples for percentile estimates"""
+
+    def __init__(self, window=HISTOGRAM_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._samples = deque(maxlen=window)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self._samples.append(value)
+
+    def summary(self):
+        samples = sorted(self._samples)
+        if not samples:
+            return {"count": 0}
+
+        def pct(p):
+            return round(samples[min(len(samples) - 1, int(p / 100.0 * len(samples)))], 2)
+
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 2),
+            "p50": pct(50),
+            "p95": pct(95),
+            "p99": pct(99),
+            "max": round(self.max, 2),
+        }
+
+
+_histograms = {}
+_counters = {}
+_metrics_lock = threading.Lock()
+_started_at = time.time()
+
+
+def observe(name, value_ms):
+    """Record one latency sample (milliseconds) into the named histogram"""
+    with _metrics_lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(value_ms)
+
+
+def increment(name, amount=1):
+    """Bump a process-wide counter"""
+    with _metrics_lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def snapshot():
+    """Current histograms (ms) and counters for this process"""
+    with _metrics_lock:
+        return {
+            "uptimeSeconds": round(time.time() - _started_at, 1),
+            "stages": {name: h.summary() for name, h in sorted(_histograms.items())},
+            "counters": dict(sorted(_counters.items())),
+        }
+
+
+def reset():
+    """Clear all histograms and counters"""
+    with _metrics_lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+class Timings:
+    """
+    Stage timings for one request.
+
+    Each span is recorded in milliseconds on the request (as_dict) and in
+    the process-wide histogram of the same name, or prefix + name for work
+    that should stay out of the request histograms (e.g. shadow runs).
+    Repeated spans with the same name (e.g. one per enrichment query) are
+    summed on the request.
+    """
+
+    def __init__(self, prefix=""):
+        self.stages = {}
+        self.prefix = prefix
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def record(self, name, elapsed_ms):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed_ms
+        observe(self.prefix + name, elapsed_ms)
+
+    def as_dict(self):
+        with self._lock:
+            return {name: round(ms, 2) for name, ms in self.stages.items()}
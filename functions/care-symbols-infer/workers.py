@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Pre-fork worker pool: several processes sharing one memory-mapped model.
+
+Inside one process, preprocessing and the Python side of every request hold
+the GIL, so one process cannot keep a many-core node busy. This module runs
+the predictor in forked worker processes instead, without paying for one
+private copy of the model per worker:
+
+1. The parent resolves the model file once (downloading it from Storage if
+   needed), maps it read-only and faults it into the page cache.
+2. It forks the workers before creating any interpreter or thread.
+3. Each worker builds its interpreter from the same file with MODEL_MMAP,
+   so the runtime maps it read-only and every worker's mapping resolves to
+   the same page-cache pages. Each worker's RSS counts the model, but its
+   PSS only counts a 1/N share, and the node holds it once.
+
+Tasks go to the workers over a local multiprocessing queue, and results come
+back on another. Workers report their RSS/PSS from /proc when they start and
+when they exit.
+
+Model configuration matches the function: --model, or MODEL_PATH /
+MODEL_BUCKET_ID + MODEL_FILE_ID (with the APPWRITE_* variables) from the
+environment.
+
+Usage:
+    python workers.py --workers 4 --input-dir archive/ --output labels.jsonl
+    python workers.py --workers 4 --manifest paths.txt --model care_symbols_model.tflite
+"""
+
+import argparse
+import json
+import mmap
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+# Package-relative import when imported as a package, plain import when run as a script
+try:
+    from .bulk_label import ResultWriter, iter_directory, iter_manifest
+    from .predict import CareSymbolPredictor, resolve_model_file
+    from .telemetry import log
+except ImportError:
+    from bulk_label import ResultWriter, iter_directory, iter_manifest
+    from predict import CareSymbolPredictor, resolve_model_file
+    from telemetry import log
+
+# Fields of /proc/<pid>/smaps_rollup the memory report reads, in kB
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def memory_usage():
+    """
+    RSS, PSS, shared and private bytes of this process (Linux only).
+
+    PSS splits each shared page between the processes mapping it, so the
+    PSS of all workers adds up to what they really cost the node.
+
+    Returns:
+        Dict of byte counts, or None where /proc/self/smaps_rollup is missing
+    """
+    usage = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in SMAPS_FIELDS:
+                    usage[key] = int(value.split()[0]) * 1024
+    except (OSError, ValueError):
+        return None
+    return {
+        "rssBytes": usage.get("Rss", 0),
+        "pssBytes": usage.get("Pss", 0),
+        "sharedBytes": usage.get("Shared_Clean", 0) + usage.get("Shared_Dirty", 0),
+        "privateBytes": usage.get("Private_Clean", 0) + usage.get("Private_Dirty", 0),
+    }
+
+
+def _worker_main(index, model_path, tasks, results):
+    """Worker process: build the predictor on the shared file, then serve tasks"""
+    os.environ["MODEL_MMAP"] = "true"
+    # One thread per interpreter unless configured; the workers are the parallelism
+    os.environ.setdefault("TFLITE_NUM_THREADS", "1")
+    try:
+        predictor = CareSymbolPredictor(model_path=model_path)
+        predictor.warmup()
+    except Exception as e:
+        results.put(("failed", index, os.getpid(), str(e)))
+        return
+    results.put(("ready", index, os.getpid(), memory_usage()))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, image_bytes, top_k, threshold, tiles = task
+        results.put(("started", task_id, index, None))
+        try:
+            predictions = predictor.predict(image_bytes, top_k=top_k, threshold=threshold, tiles=tiles)
+            results.put(("result", task_id, predictions, None))
+        except Exception as e:
+            results.put(("result", task_id, None, str(e)))
+
+    results.put(("exited", index, os.getpid(), memory_usage()))
+
+
+class WorkerPool:
+    """
+    Forked predictor processes fed from one task queue.
+
+    submit() returns a concurrent.futures.Future for each image. A collector
+    thread in the parent matches results to futures. If a worker dies, only
+    the image it was working on fails; once no worker is left, every pending
+    and later image fails.
+    """
+
+    def __init__(self, workers=None, model_path=None, model_bucket_id=None, model_file_id=None,
+                 queue_size=None):
+        self.size = max(1, int(workers or os.cpu_count() or 1))
+        self.model_path, self.model_id = resolve_model_file(model_path, model_bucket_id, model_file_id)
+
+        # Fault the model into the page cache once; the workers' mappings share it
+        with open(self.model_path, "rb") as f:
+            self._mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(self._mapping, "madvise") and hasattr(mmap, "MADV_WILLNEED"):
+            self._mapping.madvise(mmap.MADV_WILLNEED)
+        self.model_bytes = len(self._mapping)
+
+        # fork, not spawn: workers inherit the parent's imports and mapping.
+        # Nothing in the parent has started a thread or an interpreter yet.
+        context = multiprocessing.get_context("fork")
+        self._tasks = context.Queue(maxsize=queue_size or self.size * 4)
+        self._results = context.Queue()
+        self._processes = [
+            context.Process(
+                target=_worker_main, args=(i, self.model_path, self._tasks, self._results),
+                name=f"predict-worker-{i}", daemon=True
+            )
+            for i in range(self.size)
+        ]
+        for process in self._processes:
+            process.start()
+
+        self._futures = {}
+        self._running = {}      # worker index -> task id it is working on
+        self._memory = {}       # worker index -> latest memory report
+        self._pids = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._closing = False
+        self._all_dead = False
+        self._wait_ready()
+
+        self._collector = threading.Thread(target=self._collect, name="worker-results", daemon=True)
+        self._collector.start()
+
+    def _wait_ready(self):
+        """Block until every worker has loaded the model, failing if one can't"""
+        ready = set()
+        while len(ready) < self.size:
+            try:
+                kind, index, pid, detail = self._results.get(timeout=1.0)
+            except queue.Empty:
+                # A worker killed while loading (e.g. out of memory) never reports
+                for index, process in enumerate(self._processes):
+                    if index not in ready and not process.is_alive():
+                        self.close()
+                        raise RuntimeError(
+                            f"Worker {index} died while loading the model (exit code {process.exitcode})"
+                        )
+                continue
+            if kind == "failed":
+                self.close()
+                raise RuntimeError(f"Worker {index} failed to load the model: {detail}")
+            self._pids[index] = pid
+            self._memory[index] = detail
+            ready.add(index)
+        log(f"{self.size} workers ready on {self.model_path} ({self.model_bytes} bytes, shared)")
+
+    def submit(self, image_bytes, top_k=5, threshold=0.1, tiles=0):
+        """Queue one image; blocks while the task queue is full"""
+        future = Future()
+        with self._lock:
+            if self._all_dead:
+                future.set_exception(RuntimeError("No worker is alive"))
+                return future
+            task_id = self._next_id
+            self._next_id += 1
+            self._futures[task_id] = future
+        while True:
+            try:
+                self._tasks.put((task_id, image_bytes, top_k, threshold, tiles), timeout=1.0)
+                return future
+            except queue.Full:
+                # Nobody will drain the queue once every worker is gone
+                if self._all_dead:
+                    return future
+
+    def _collect(self):
+        while True:
+            try:
+                kind, key, value, detail = self._results.get(timeout=1.0)
+            except queue.Empty:
+                self._check_workers()
+                if self._closing and all(not p.is_alive() for p in self._processes):
+                    return
+                continue
+
+            if kind == "started":
+                with self._lock:
+                    self._running[value] = key
+            elif kind == "result":
+                with self._lock:
+                    future = self._futures.pop(key, None)
+                    for index, task_id in list(self._running.items()):
+                        if task_id == key:
+                            del self._running[index]
+                if future is not None:
+                    if detail is None:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(RuntimeError(detail))
+            elif kind == "exited":
+                self._memory[key] = detail
+
+    def _check_workers(self):
+        """
+        Fail the task of any worker that died without finishing it, and every
+        pending task once no worker is left alive.
+        """
+        for index, process in enumerate(self._processes):
+            if process.is_alive() or process.exitcode == 0:
+                continue
+            with self._lock:
+                task_id = self._running.pop(index, None)
+                future = self._futures.pop(task_id, None) if task_id is not None else None
+            if future is not None:
+                log(f"Worker {index} died (exit code {process.exitcode})", "ERROR")
+                future.set_exception(RuntimeError(f"Worker {index} died (exit code {process.exitcode})"))
+
+        if self._closing or any(process.is_alive() for process in self._processes):
+            return
+        with self._lock:
+            self._all_dead = True
+            pending = list(self._futures.values())
+            self._futures.clear()
+            self._running.clear()
+        if pending:
+            log(f"No worker is alive, failing {len(pending)} pending tasks", "ERROR")
+        for future in pending:
+            future.set_exception(RuntimeError("No worker is alive"))
+
+    def memory(self):
+        """Latest memory report of every worker and of the parent, with totals"""
+        workers = [
+            dict(self._memory.get(i) or {}, worker=i, pid=self._pids.get(i))
+            for i in range(self.size)
+        ]
+        return {
+            "modelBytes": self.model_bytes,
+            "parent": memory_usage(),
+            "workers": workers,
+            "totalRssBytes": sum(w.get("rssBytes", 0) for w in workers),
+            "totalPssBytes": sum(w.get("pssBytes", 0) for w in workers),
+        }
+
+    def close(self):
+        """Finish queued tasks, stop the workers and collect their final memory reports"""
+        self._closing = True
+        stops = len(self._processes)
+        while stops:
+            try:
+                self._tasks.put(None, timeout=1.0)
+                stops -= 1
+            except queue.Full:
+                # Dead workers can't drain the queue; stop waiting once all are gone
+                if not any(process.is_alive() for process in self._processes):
+                    break
+        for process in self._processes:
+            process.join()
+        # Tasks still buffered for workers that died will never be read;
+        # don't let flushing them block interpreter exit
+        self._tasks.cancel_join_thread()
+        collector = getattr(self, "_collector", None)
+        if collector is not None:
+            collector.join()
+        self._mapping.close()
+
+
+def run(args):
+    """Label images from a directory or manifest with the worker pool"""
+    fmt = "csv" if args.output and args.output.endswith(".csv") else "jsonl"
+    pool = WorkerPool(
+        workers=args.workers,
+        model_path=args.model or os.environ.get("MODEL_PATH"),
+        model_bucket_id=os.environ.get("MODEL_BUCKET_ID"),
+        model_file_id=os.environ.get("MODEL_FILE_ID"),
+    )
+    started_memory = pool.memory()
+    paths = iter_manifest(args.manifest) if args.manifest else iter_directory(args.input_dir)
+    writer = ResultWriter(args.output, fmt, append=False) if args.output else None
+
+    labeled = failed = 0
+
+    def finish(path, future):
+        nonlocal labeled, failed
+        try:
+            predictions = future.result()
+            labeled += 1
+            if writer is not None:
+                writer.write(path, predictions=predictions)
+        except Exception as e:
+            failed += 1
+            if writer is not None:
+                writer.write(path, error=str(e))
+
+    started = time.perf_counter()
+    # Results are written in input order, with a bounded number in flight
+    pending = deque()
+    window = pool.size * 8
+    try:
+        for path in paths:
+            try:
+                with open(path, "rb") as f:
+                    image_bytes = f.read()
+            except OSError as e:
+                failed += 1
+                if writer is not None:
+                    writer.write(path, error=str(e))
+                continue
+            pending.append((path, pool.submit(image_bytes, args.top_k, args.threshold, args.tiles)))
+            if len(pending) >= window:
+                finish(*pending.popleft())
+        while pending:
+            finish(*pending.popleft())
+    finally:
+        elapsed = time.perf_counter() - started
+        pool.close()
+        if writer is not None:
+            writer.close()
+
+    return {
+        "labeled": labeled,
+        "failed": failed,
+        "seconds": round(elapsed, 2),
+        "imagesPerSecond": round((labeled + failed) / elapsed, 2) if elapsed else None,
+        "workers": pool.size,
+        "modelId": pool.model_id,
+        "memoryAtStart": started_memory,
+        "memoryAtExit": pool.memory(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input-dir", help="Directory tree of images")
+    source.add_argument("--manifest", help="File listing image paths (.txt, .csv with 'path', or .jsonl)")
+    parser.add_argument("--output", help="Results file (.jsonl or .csv); omit to only measure")
+    parser.add_argument("--model", help="TFLite model path (default: MODEL_PATH or Storage variables)")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("PREDICT_WORKERS") or 0) or None,
+                        help="Worker processes (default: PREDICT_WORKERS or the number of cores)")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--tiles", type=int, default=0, help="Tile budget per image (see tiled inference)")
+    args = parser.parse_args()
+
+    summary = run(args)
+    print(json.dumps(summary, indent=2))
+    return 0 if summary["labeled"] or not summary["failed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())